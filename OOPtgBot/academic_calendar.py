@@ -0,0 +1,178 @@
+"""
+Учебный календарь: начала семестров, праздники и ручная смена чётности недель.
+
+Календарь один раз раскладывается в таблицу "день -> (чётность, номер недели,
+праздник)" на весь интервал семестров, поэтому вопрос "какая сейчас неделя"
+стоит одного обращения к словарю. Даты вне семестров (каникулы) получают
+чётность по ближайшему предыдущему семестру.
+
+Формат файла (JSON):
+    {
+        "semesters": [{"name": "...", "start": "2025-09-01", "end": "2026-01-31", "first_week": "1"}],
+        "holidays": ["2025-11-04", {"from": "2025-12-31", "to": "2026-01-08"}],
+        "week_overrides": {"2026-03-09": "1"}
+    }
+week_overrides задаёт чётность всей недели (пн-вс), в которую попадает дата.
+"""
+
+import json
+import logging
+import os
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DateLike = Union[date, datetime]
+
+# Календарь без файла настроек: прежнее поведение бота (отсчёт от 2 сентября 2024)
+DEFAULT_CONFIG = {
+    "semesters": [
+        {"name": "Осень 2024", "start": "2024-09-02", "end": "2025-08-31", "first_week": "1"}
+    ],
+    "holidays": [],
+    "week_overrides": {}
+}
+
+
+def _parse_date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _monday(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+class AcademicCalendar:
+    """Чётность и номер учебной недели для любой даты за O(1)"""
+
+    # Файл лежит рядом с кодом бота, а не в текущем каталоге запуска
+    DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "academic_calendar.json")
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self.config: Dict = DEFAULT_CONFIG
+        # порядковый номер дня -> (чётность '1'/'2', номер недели в семестре, праздник)
+        self._days: Dict[int, Tuple[str, int, bool]] = {}
+        self._starts: List[int] = []                       # понедельники начала семестров
+        self._semesters: List[Tuple[int, str]] = []        # (понедельник начала, чётность первой недели)
+        self._bounds: List[Tuple[date, date]] = []         # (первый, последний день) каждого семестра
+        self.compile(DEFAULT_CONFIG)
+
+    def load(self) -> None:
+        """Прочитать календарь из файла; без файла остаётся календарь по умолчанию"""
+        if not os.path.exists(self.path):
+            logger.info(f"Файл календаря {self.path} не найден, используется календарь по умолчанию")
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            self.compile(config)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать календарь {self.path}: {e}")
+            return
+
+        logger.info(f"Загружен учебный календарь: семестров {len(config.get('semesters', []))}")
+
+    def compile(self, config: Dict) -> None:
+        """Разложить календарь в таблицу по дням"""
+        semesters = sorted(
+            (
+                _monday(_parse_date(semester["start"])),
+                _parse_date(semester["end"]),
+                "2" if str(semester.get("first_week", "1")) == "2" else "1",
+                _parse_date(semester["start"])
+            )
+            for semester in config.get("semesters", [])
+        )
+        if not semesters:
+            raise ValueError("В календаре нет ни одного семестра")
+
+        holidays = set()
+        for holiday in config.get("holidays", []):
+            if isinstance(holiday, dict):
+                day, last = _parse_date(holiday["from"]), _parse_date(holiday["to"])
+            else:
+                day = last = _parse_date(holiday)
+            while day <= last:
+                holidays.add(day.toordinal())
+                day += timedelta(days=1)
+
+        overrides = {
+            _monday(_parse_date(day)).toordinal(): "2" if str(week) == "2" else "1"
+            for day, week in config.get("week_overrides", {}).items()
+        }
+
+        days = {}
+        bounds = []
+        for i, (start, end, first_week, first_day) in enumerate(semesters):
+            # Семестр длится до своего конца, но не дальше начала следующего
+            if i + 1 < len(semesters):
+                end = min(end, semesters[i + 1][0] - timedelta(days=1))
+            # Счёт недель идёт с понедельника, а занятия - с настоящей даты начала
+            bounds.append((first_day, end))
+
+            day = start
+            while day <= end:
+                ordinal = day.toordinal()
+                week_number = (ordinal - start.toordinal()) // 7 + 1
+                monday = ordinal - day.weekday()
+                week_type = overrides.get(monday) or self._parity(first_week, week_number)
+                days[ordinal] = (week_type, week_number, ordinal in holidays)
+                day += timedelta(days=1)
+
+        self.config = config
+        self._days = days
+        self._starts = [start.toordinal() for start, _, _, _ in semesters]
+        self._semesters = [(start.toordinal(), first_week) for start, _, first_week, _ in semesters]
+        self._bounds = bounds
+
+    @staticmethod
+    def _parity(first_week: str, week_number: int) -> str:
+        """Чётность недели с номером week_number, если первая неделя семестра - first_week"""
+        odd = (week_number % 2 == 1) == (first_week == "1")
+        return "1" if odd else "2"
+
+    def _lookup(self, day: DateLike) -> Optional[Tuple[str, int, bool]]:
+        return self._days.get(day.toordinal())
+
+    def week_type(self, day: Optional[DateLike] = None) -> str:
+        """Чётность недели: '1' - нечётная, '2' - чётная"""
+        day = day or datetime.now()
+        found = self._lookup(day)
+        if found is not None:
+            return found[0]
+
+        # Вне таблицы - продолжаем счёт недель ближайшего предыдущего семестра
+        ordinal = day.toordinal()
+        position = max(bisect_right(self._starts, ordinal) - 1, 0)
+        start, first_week = self._semesters[position]
+        week_number = max(ordinal - start, 0) // 7 + 1
+        return self._parity(first_week, week_number)
+
+    def week_number(self, day: Optional[DateLike] = None) -> Optional[int]:
+        """Номер недели в семестре или None вне семестров"""
+        found = self._lookup(day or datetime.now())
+        return found[1] if found else None
+
+    def is_holiday(self, day: Optional[DateLike] = None) -> bool:
+        found = self._lookup(day or datetime.now())
+        return bool(found and found[2])
+
+    def semester_bounds(self, day: Optional[DateLike] = None) -> Optional[Tuple[date, date]]:
+        """
+        Первый и последний день семестра, в который попадает день
+
+        На каникулах - ближайший следующий семестр. После последнего семестра
+        календаря - None: календарь пора дополнить, а прошедший семестр не нужен.
+        """
+        day = day or datetime.now()
+        if isinstance(day, datetime):
+            day = day.date()
+
+        for start, end in self._bounds:
+            if day <= end:
+                return start, end
+        return None
@@ -1,121 +1,293 @@
-import requests
-import json
-from datetime import datetime
-from typing import Optional, Dict, List
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import Callable, Optional, Dict, List
+from academic_calendar import AcademicCalendar
+from ics_export import IcsExport
+from lesson import Lesson
+from lru_cache import LRUCache
+from metrics import instrument_api
+from schedule_index import ReverseIndex, ScheduleIndex
+from schedule_store import ScheduleStore, ScheduleFetchError
+
+logger = logging.getLogger(__name__)
 
 class LETIScheduleAPI:
     """Класс для работы с API расписания ЛЭТИ"""
     
     BASE_URL = "https://digital.etu.ru/api/mobile"
+    MESSAGE_LIMIT = 4096    # максимальная длина сообщения Telegram
+    MAX_RANGE_DAYS = 62     # самый длинный период для get_range_schedule
+    MAX_MATCHES = 10        # сколько имён показывать при поиске преподавателя или аудитории
+    DAY_NAMES = ["ПОНЕДЕЛЬНИК", "ВТОРНИК", "СРЕДА", "ЧЕТВЕРГ", "ПЯТНИЦА", "СУББОТА", "ВОСКРЕСЕНЬЕ"]
     
     @staticmethod
-    def get_group_schedule(
+    def schedule_from_index(
+        index: ScheduleIndex,
         group_number: str,
         week_type: Optional[str] = None,
         day: Optional[str] = None
     ) -> Dict:
-        """
-        Получить расписание группы
+        """Собрать ответ get_group_schedule по готовому индексу (без ожидания загрузки, как в inline-режиме)"""
+        # 2. Ищем нашу группу
+        if not index.has_group(group_number):
+            return LETIScheduleAPI._group_not_found(index, group_number)
         
-        Args:
-            group_number: номер группы (например '4352')
-            week_type: тип недели ('1' - нечетная, '2' - четная)
-            day: номер дня (0-понедельник, 1-вторник, ...) или название
-        """
-        try:
-            # 1. Получаем все данные
-            url = f"{LETIScheduleAPI.BASE_URL}/schedule"
-            response = requests.get(url, timeout=15, verify=False)
-            
-            if response.status_code != 200:
-                return {
-                    "success": False,
-                    "error": f"Ошибка API: {response.status_code}"
-                }
-            
-            all_data = response.json()
-            
-            # 2. Ищем нашу группу
-            if group_number not in all_data:
-                return {
-                    "success": False,
-                    "error": f"Группа {group_number} не найдена"
-                }
-            
-            group_data = all_data[group_number]
-            
-            # 3. Извлекаем занятия из структуры days
-            all_lessons = []
-            days_data = group_data.get("days", {})
-            
-            # Преобразуем дни из словаря в список
-            for day_num, day_info in days_data.items():
-                day_name = day_info.get("name", "").strip().lower()
-                lessons = day_info.get("lessons", [])
-                
-                # Добавляем информацию о дне к каждому занятию
-                for lesson in lessons:
-                    lesson_with_day = lesson.copy()
-                    lesson_with_day["day_number"] = day_num
-                    lesson_with_day["day_name"] = day_name
-                    all_lessons.append(lesson_with_day)
-            
-            print(f"📊 Всего занятий для группы {group_number}: {len(all_lessons)}")
-            
-            # 4. Фильтруем по неделе и дню
-            filtered_lessons = []
-            
-            for lesson in all_lessons:
-                # Проверяем неделю (week: "1" или "2")
-                lesson_week = lesson.get("week", "")
-                week_match = True
-                
-                if week_type:
-                    # Приводим к формату API ("1"/"2")
-                    if week_type.lower() in ["odd", "нечетная", "odd_week", "1"]:
-                        target_week = "1"
-                    elif week_type.lower() in ["even", "четная", "even_week", "2"]:
-                        target_week = "2"
-                    else:
-                        target_week = week_type
-                    
-                    week_match = (lesson_week == target_week)
-                
-                # Проверяем день
-                day_match = True
-                if day:
-                    # День может быть: числом (0-6), названием на рус/англ
-                    lesson_day_num = lesson.get("day_number", "")
-                    lesson_day_name = lesson.get("day_name", "")
-                    
-                    day_str = str(day).lower().strip()
-                    
-                    # Проверяем совпадение
-                    if day_str in ["0", "1", "2", "3", "4", "5", "6"]:
-                        # Ищем по номеру дня
-                        day_match = (lesson_day_num == day_str)
-                    else:
-                        # Ищем по названию
-                        day_match = (lesson_day_name == day_str)
-                
-                if week_match and day_match:
-                    filtered_lessons.append(lesson)
+        all_lessons_count = index.total_lessons(group_number)
+        # Вызывается на каждый inline-запрос по нескольку раз - не пишем в stdout
+        logger.debug(f"Всего занятий для группы {group_number}: {all_lessons_count}")
+        
+        # 3. Берём готовую таблицу по неделе и дню
+        filtered_lessons = index.lookup(group_number, week_type, day)
+        
+        return {
+            "success": True,
+            "group": group_number,
+            "week_type": week_type,
+            "day": day,
+            "lessons": filtered_lessons,
+            "total_lessons": len(filtered_lessons),
+            "all_lessons_count": all_lessons_count,
+            "version": index.version
+        }
+    
+    @staticmethod
+    def _group_not_found(index: ScheduleIndex, group_number: str) -> Dict:
+        """Ответ для несуществующей группы - с подсказками похожих номеров"""
+        suggestions = index.suggest_groups(group_number)
+        error = f"Группа {group_number} не найдена"
+        if suggestions:
+            error += f". Возможно, вы имели в виду: {', '.join(suggestions)}"
+        
+        return {
+            "success": False,
+            "error": error,
+            "suggestions": suggestions
+        }
+    
+    @staticmethod
+    def next_lesson_from_index(
+        index: ScheduleIndex,
+        group_number: str,
+        moment: Optional[datetime] = None
+    ) -> Dict:
+        """Найти ближайшее занятие по готовому индексу (без ожидания загрузки, как в inline-режиме)"""
+        if not index.has_group(group_number):
+            return LETIScheduleAPI._group_not_found(index, group_number)
+        
+        moment = moment or datetime.now()
+        minutes = moment.hour * 60 + moment.minute
+        week_type = LETIScheduleAPI.determine_current_week_for_date(moment)
+        
+        found = index.next_lesson(group_number, week_type, moment.weekday(), minutes)
+        if found is None:
+            return {"success": True, "group": group_number, "lesson": None}
+        
+        lesson, minutes_ahead = found
+        return {
+            "success": True,
+            "group": group_number,
+            "lesson": lesson,
+            "minutes_ahead": minutes_ahead,
+            "days_ahead": (minutes + minutes_ahead) // (24 * 60)
+        }
+    
+    @staticmethod
+    def _range_from_index(
+        index: ScheduleIndex,
+        group_number: str,
+        start: Optional[date] = None,
+        days: int = 14
+    ) -> Dict:
+        """Разложить занятия группы по датам периода за один проход по индексу"""
+        if not index.has_group(group_number):
+            return LETIScheduleAPI._group_not_found(index, group_number)
+        
+        start = start or datetime.now().date()
+        days = max(1, min(days, LETIScheduleAPI.MAX_RANGE_DAYS))
+        
+        # Один проход по занятиям группы: (чётность или None - каждую неделю, день) -> занятия
+        slots = {}
+        for lesson in index.group_lessons(group_number):
+            week = lesson.week if lesson.week in ("1", "2") else None
+            slots.setdefault((week, lesson.day), []).append(lesson)
+        
+        dates = []
+        total = 0
+        for offset in range(days):
+            current = start + timedelta(days=offset)
+            week_type = academic_calendar.week_type(current)
+            weekday = current.weekday()
             
+            lessons = slots.get((week_type, weekday), []) + slots.get((None, weekday), [])
+            lessons.sort(key=lambda lesson: lesson.sort_key)
+            total += len(lessons)
+            dates.append((current, week_type, academic_calendar.is_holiday(current), tuple(lessons)))
+        
+        return {
+            "success": True,
+            "group": group_number,
+            "start": start,
+            "days": days,
+            "dates": dates,
+            "total_lessons": total,
+            "version": index.version
+        }
+    
+    @staticmethod
+    def _free_slots_from_index(
+        index: ScheduleIndex,
+        group_numbers: List[str],
+        week_type: Optional[str] = None
+    ) -> Dict:
+        """Найти общие окна групп по битсетам занятости из индекса"""
+        for group_number in group_numbers:
+            if not index.has_group(group_number):
+                return LETIScheduleAPI._group_not_found(index, group_number)
+        
+        return {
+            "success": True,
+            "groups": group_numbers,
+            "week_type": week_type,
+            "slots": index.common_free_slots(group_numbers, week_type)
+        }
+    
+    @staticmethod
+    def format_free_slots(free_data: Dict) -> str:
+        """Текст с общими окнами групп для Telegram"""
+        if not free_data["success"]:
+            return f"❌ {free_data['error']}"
+        
+        groups = ", ".join(free_data["groups"])
+        if not free_data["slots"]:
+            return f"📭 У групп {groups} нет общих окон с 08:00 до 20:00"
+        
+        parts = [f"🪟 *Общие окна групп {groups}*\n"]
+        current = None
+        for week, day, start, end in free_data["slots"]:
+            if (week, day) != current:
+                week_text = "нечетная" if week == "1" else "четная"
+                parts.append(f"\n*{LETIScheduleAPI.DAY_NAMES[day]}* ({week_text} неделя)\n")
+                current = (week, day)
+            parts.append(f"🕐 {Lesson.format_minutes(start)}-{Lesson.format_minutes(end)}\n")
+        
+        return "".join(parts)
+    
+    @staticmethod
+    def _lessons_by_from_index(index: ScheduleIndex, kind: str, query: str) -> Dict:
+        """Поиск по обратному индексу преподавателей или аудиторий"""
+        reverse = index.teachers if kind == "teacher" else index.rooms
+        matches = reverse.search(query, limit=LETIScheduleAPI.MAX_MATCHES + 1)
+        
+        if not matches:
+            what = "Преподаватель" if kind == "teacher" else "Аудитория"
             return {
-                "success": True,
-                "group": group_number,
-                "week_type": week_type,
-                "day": day,
-                "lessons": filtered_lessons,
-                "total_lessons": len(filtered_lessons),
-                "all_lessons_count": len(all_lessons)
+                "success": False,
+                "error": f"{what} «{query}» не найден(а) в расписании"
             }
+        
+        # Точное совпадение выигрывает у более длинных имён с тем же началом
+        exact = [name for name in matches if reverse.normalize(name) == reverse.normalize(query)]
+        name = exact[0] if exact else matches[0] if len(matches) == 1 else None
+        
+        return {
+            "success": True,
+            "kind": kind,
+            "query": query,
+            "matches": matches[:LETIScheduleAPI.MAX_MATCHES],
+            "more": len(matches) > LETIScheduleAPI.MAX_MATCHES,
+            "name": name,
+            "lessons": reverse.lessons(name) if name else [],
+            "version": index.version
+        }
+    
+    @staticmethod
+    def format_lessons_by(data: Dict) -> List[str]:
+        """Расписание преподавателя или аудитории (страницы) либо список найденных имён"""
+        if not data["success"]:
+            return [f"❌ {data['error']}"]
+        
+        command = "/teacher" if data["kind"] == "teacher" else "/room"
+        if data["name"] is None:
+            lines = ["🔎 *Найдено несколько совпадений:*", ""]
+            lines.extend(f"• `{command} {name}`" for name in data["matches"])
+            if data["more"]:
+                lines.append("… уточните запрос")
+            return ["\n".join(lines)]
+        
+        cache_key = (data["kind"], ReverseIndex.normalize(data["name"]), data["version"])
+        cached = render_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        icon = "👨‍🏫" if data["kind"] == "teacher" else "🚪"
+        header = f"{icon} *{data['name']}*\n\n"
+        
+        # Поток (одно занятие у нескольких групп) показываем одной строкой
+        merged = {}
+        for group, lesson in data["lessons"]:
+            key = (lesson.week, lesson.day, lesson.start, lesson.name, lesson.room, lesson.teacher)
+            merged.setdefault(key, (lesson, []))[1].append(group)
+        
+        blocks = []
+        parts = None
+        current = None
+        for lesson, groups in merged.values():
+            if (lesson.week, lesson.day) != current:
+                if parts:
+                    blocks.append("".join(parts))
+                week_text = {"1": " (нечетная неделя)", "2": " (четная неделя)"}.get(lesson.week, "")
+                parts = [f"*{lesson.day_name.upper()}*{week_text}\n"]
+                current = (lesson.week, lesson.day)
             
-        except Exception as e:
+            parts.append(f"🕐 *{lesson.start_time}-{lesson.end_time}* {lesson.name or 'Не указано'}")
+            if lesson.subject_type:
+                parts.append(f" ({lesson.subject_type})")
+            parts.append(f"\n👥 {', '.join(groups)}")
+            # Для преподавателя важна аудитория, для аудитории - преподаватель
+            other = lesson.room if data["kind"] == "teacher" else lesson.teacher
+            if other:
+                parts.append(f" · {other}")
+            parts.append("\n\n")
+        if parts:
+            blocks.append("".join(parts))
+        
+        pages = LETIScheduleAPI.paginate(header, blocks)
+        render_cache.put(cache_key, pages)
+        return pages
+    
+    @staticmethod
+    def _ics_from_index(index: ScheduleIndex, group_number: str) -> Dict:
+        """
+        Собрать .ics по индексу
+        
+        Файл кэшируется по (группа, семестр, версия данных): когда его просит
+        вся группа, календарь собирается один раз.
+        """
+        if not index.has_group(group_number):
+            return LETIScheduleAPI._group_not_found(index, group_number)
+        
+        semester = academic_calendar.semester_bounds(datetime.now())
+        if semester is None:
             return {
                 "success": False,
-                "error": f"Ошибка: {str(e)}"
+                "error": "В учебном календаре нет текущего или следующего семестра, выгрузить расписание не получится"
             }
+        
+        cache_key = ("ics", group_number, semester, index.version)
+        content = render_cache.get(cache_key)
+        if content is None:
+            content = IcsExport.build(group_number, index.group_lessons(group_number), academic_calendar, semester)
+            render_cache.put(cache_key, content)
+        
+        return {
+            "success": True,
+            "group": group_number,
+            "filename": f"leti_{group_number}_{semester[0]:%Y%m%d}.ics",
+            "content": content,
+            "semester": semester,
+            "version": index.version
+        }
     
     @staticmethod
     def determine_current_week() -> str:
@@ -123,31 +295,8 @@ class LETIScheduleAPI:
         Определить текущую учебную неделю
         Возвращает: '1' - нечетная неделя, '2' - четная неделя
         """
-        # Начало осеннего семестра 2024-2025
-        # 2 сентября 2024 - понедельник, НЕЧЕТНАЯ неделя (1)
-        SEMESTER_START = datetime(2024, 9, 2)
-        
-        today = datetime.now()
-        
-        # Вычисляем разницу в днях
-        days_passed = (today - SEMESTER_START).days
-        
-        # Если сегодня раньше начала семестра (например, тестируем)
-        if days_passed < 0:
-            # Для тестирования: используем текущую дату
-            days_passed = (datetime.now() - datetime(2024, 12, 16)).days
-            if days_passed < 0:
-                days_passed = 0
-        
-        # Вычисляем номер недели (начинаем с 1)
-        week_number = days_passed // 7 + 1
-        
-        # Определяем четность: 1,3,5... - нечетные, 2,4,6... - четные
-        # В API: "1" = нечетная неделя, "2" = четная неделя
-        if week_number % 2 == 1:  # Нечетная неделя
-            return "1"
-        else:  # Четная неделя
-            return "2"
+        # Чётность берётся из заранее разложенного учебного календаря
+        return academic_calendar.week_type(datetime.now())
     
     @staticmethod
     def normalize_week_type(week_input: str) -> str:
@@ -171,14 +320,7 @@ class LETIScheduleAPI:
     @staticmethod
     def determine_current_week_for_date(target_date: datetime) -> str:
         """Определить тип недели для конкретной даты"""
-        SEMESTER_START = datetime(2024, 9, 2)
-        days_passed = (target_date - SEMESTER_START).days
-        
-        if days_passed < 0:
-            days_passed = 0
-        
-        week_number = days_passed // 7 + 1
-        return "1" if week_number % 2 == 1 else "2"
+        return academic_calendar.week_type(target_date)
     
     @staticmethod
     def get_current_day_info() -> Dict:
@@ -289,22 +431,84 @@ class LETIScheduleAPI:
         return day.upper()
     
     @staticmethod
+    @instrument_api("format_schedule_for_display")
     def format_schedule_for_display(schedule_data: Dict) -> str:
-        """Форматировать расписание для вывода в Telegram"""
+        """
+        Форматировать расписание для вывода в Telegram
+        
+        Готовые сообщения кэшируются по (группа, неделя, день, версия данных):
+        одинаковые запросы между обновлениями расписания не перерисовываются.
+        """
         if not schedule_data["success"]:
             return f"❌ {schedule_data['error']}"
         
+        cache_key = (
+            schedule_data["group"],
+            schedule_data.get("week_type"),
+            schedule_data.get("day"),
+            schedule_data.get("version")
+        )
+        cached = render_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        response = LETIScheduleAPI._render_schedule(schedule_data)
+        render_cache.put(cache_key, response)
+        return response
+    
+    @staticmethod
+    @instrument_api("format_schedule_pages")
+    def format_schedule_pages(schedule_data: Dict) -> List[str]:
+        """
+        То же, что format_schedule_for_display, но разбитое на сообщения
+        не длиннее MESSAGE_LIMIT по границам дней
+        
+        Страницы собираются один раз на (группа, неделя, день, версия данных),
+        листание кнопками берёт их из кэша.
+        """
+        if not schedule_data["success"]:
+            return [f"❌ {schedule_data['error']}"]
+        
+        cache_key = (
+            "pages",
+            schedule_data["group"],
+            schedule_data.get("week_type"),
+            schedule_data.get("day"),
+            schedule_data.get("version")
+        )
+        cached = render_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        if schedule_data["lessons"]:
+            header, blocks = LETIScheduleAPI._schedule_blocks(schedule_data)
+            pages = LETIScheduleAPI.paginate(header, blocks)
+        else:
+            pages = [LETIScheduleAPI._render_schedule(schedule_data)]
+        
+        render_cache.put(cache_key, pages)
+        return pages
+    
+    @staticmethod
+    def _render_schedule(schedule_data: Dict) -> str:
+        """Собрать текст расписания (без кэша)"""
         lessons = schedule_data["lessons"]
         if not lessons:
             return "📭 На выбранный период занятий не найдено"
         
-        # Сортировка: сначала по дню, потом по времени
-        lessons_sorted = sorted(lessons, key=lambda x: (
-            x.get("day_number", "999"),
-            x.get("start_time_seconds", 0)
-        ))
+        header, blocks = LETIScheduleAPI._schedule_blocks(schedule_data)
+        return header + "".join(blocks)
+    
+    @staticmethod
+    def _schedule_blocks(schedule_data: Dict):
+        """
+        Заголовок и текст по дням (каждый день - отдельный блок)
         
-        # Формируем ответ
+        Returns:
+            (заголовок, список блоков дней)
+        """
+        # Формируем ответ по частям и склеиваем один раз в конце.
+        # Занятия приходят из индекса уже отсортированными по дню и времени.
         week_type = schedule_data.get("week_type", "")
         week_text = ""
         if week_type == "1":
@@ -312,47 +516,273 @@ class LETIScheduleAPI:
         elif week_type == "2":
             week_text = "четная неделя"
         
-        response = f"📅 *Расписание группы {schedule_data['group']}*"
+        header = f"📅 *Расписание группы {schedule_data['group']}*"
         if week_text:
-            response += f" ({week_text})"
-        response += "\n\n"
+            header += f" ({week_text})"
+        header += "\n\n"
         
+        blocks = []
+        parts = None
         current_day = None
-        for lesson in lessons_sorted:
-            day_name = lesson.get("day_name", "").upper()
+        for lesson in schedule_data["lessons"]:
+            day_name = lesson.day_name.upper()
             
-            # Добавляем заголовок дня, если он изменился
+            # Новый день - новый блок со своим заголовком
             if day_name != current_day:
-                response += f"*{day_name}*\n"
+                if parts:
+                    blocks.append("".join(parts))
+                parts = [f"*{day_name}*\n"]
                 current_day = day_name
             
-            # Извлекаем данные
-            time_start = lesson.get("start_time", "??:??")
-            time_end = lesson.get("end_time", "??:??")
-            subject = lesson.get("name", "Не указано")
-            teacher = lesson.get("teacher", "")
-            room = lesson.get("room", "")
-            subject_type = lesson.get("subjectType", "")
-            week = lesson.get("week", "")
-            form = lesson.get("form", "")
-            
-            # Форматируем занятие
-            response += f"🕐 *{time_start}-{time_end}*"
-            
-            if subject_type:
-                response += f" ({subject_type})"
-            
-            response += f"\n📚 {subject}\n"
-            
-            if teacher:
-                response += f"👨‍🏫 {teacher}\n"
-            
-            if room:
-                response += f"🚪 {room}\n"
-            elif form:
-                response += f"🌐 {form}\n"
+            LETIScheduleAPI._render_lesson(lesson, parts)
+        
+        if parts:
+            blocks.append("".join(parts))
+        return header, blocks
+    
+    @staticmethod
+    def _render_lesson(lesson: Lesson, parts: List[str]) -> None:
+        """Добавить в parts строки одного занятия"""
+        # Извлекаем данные
+        time_start = lesson.start_time
+        time_end = lesson.end_time
+        subject = lesson.name or "Не указано"
+        teacher = lesson.teacher
+        room = lesson.room
+        subject_type = lesson.subject_type
+        week = lesson.week
+        form = lesson.form
+        
+        # Форматируем занятие
+        parts.append(f"🕐 *{time_start}-{time_end}*")
+        
+        if subject_type:
+            parts.append(f" ({subject_type})")
+        
+        parts.append(f"\n📚 {subject}\n")
+        
+        if teacher:
+            parts.append(f"👨‍🏫 {teacher}\n")
+        
+        if room:
+            parts.append(f"🚪 {room}\n")
+        elif form:
+            parts.append(f"🌐 {form}\n")
+        
+        parts.append(f"📆 Неделя: {week}\n")
+        parts.append("───────────────\n\n")
+    
+    @staticmethod
+    @instrument_api("format_range_for_display")
+    def format_range_for_display(range_data: Dict) -> List[str]:
+        """
+        Текст расписания на период, разбитый на сообщения не длиннее MESSAGE_LIMIT
+        
+        Сообщения режутся только между днями; готовые страницы кэшируются
+        по (группа, начало, длина периода, версия данных).
+        """
+        if not range_data["success"]:
+            return [f"❌ {range_data['error']}"]
+        
+        cache_key = ("range", range_data["group"], range_data["start"], range_data["days"], range_data["version"])
+        cached = render_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        last_day = range_data["start"] + timedelta(days=range_data["days"] - 1)
+        header = (
+            f"📅 *Расписание группы {range_data['group']}*\n"
+            f"с {range_data['start']:%d.%m} по {last_day:%d.%m}\n\n"
+        )
+        
+        blocks = []
+        for current, week_type, holiday, lessons in range_data["dates"]:
+            if not lessons:
+                continue
             
-            response += f"📆 Неделя: {week}\n"
-            response += "───────────────\n\n"
+            week_text = "нечетная" if week_type == "1" else "четная"
+            parts = [f"*{LETIScheduleAPI.DAY_NAMES[current.weekday()]}, {current:%d.%m}* ({week_text} неделя)"]
+            if holiday:
+                parts.append(" 🎉 праздник")
+            parts.append("\n")
+            for lesson in lessons:
+                LETIScheduleAPI._render_lesson(lesson, parts)
+            blocks.append("".join(parts))
+        
+        if not blocks:
+            pages = [header + "📭 На выбранный период занятий не найдено"]
+        else:
+            pages = LETIScheduleAPI.paginate(header, blocks)
+        
+        render_cache.put(cache_key, pages)
+        return pages
+    
+    @staticmethod
+    def _telegram_length(text: str) -> int:
+        """Длина текста так, как её считает Telegram (в единицах UTF-16)"""
+        return len(text.encode("utf-16-le")) // 2
+    
+    @staticmethod
+    def paginate(header: str, blocks: List[str], limit: int = MESSAGE_LIMIT) -> List[str]:
+        """Сложить блоки (дни) в сообщения не длиннее limit, не разрывая блоки"""
+        length = LETIScheduleAPI._telegram_length
+        
+        # День длиннее сообщения режем по строкам: сущности разметки не переходят через строку.
+        # Символ занимает не больше двух единиц UTF-16, так что limit // 2 символов точно влезут
+        pieces = []
+        for block in blocks:
+            while length(block) > limit:
+                cut = block.rfind("\n", 0, limit // 2) + 1 or limit // 2
+                pieces.append(block[:cut])
+                block = block[cut:]
+            pieces.append(block)
+        
+        pages = []
+        current = header
+        for piece in pieces:
+            if current and length(current) + length(piece) > limit:
+                pages.append(current)
+                current = ""
+            current += piece
+        
+        if current:
+            pages.append(current)
+        return pages
+
+class AsyncLETIScheduleAPI(LETIScheduleAPI):
+    """Получение расписания для обработчиков бота без блокировки цикла событий"""
+    
+    @staticmethod
+    async def _with_index(build: Callable[..., Dict], *args, in_thread: bool = False) -> Dict:
+        """
+        Получить индекс из общего кэша и собрать по нему ответ
+        
+        Ошибка загрузки расписания возвращается в обычном формате ответа
+        (success=False), а не исключением.
+        
+        Args:
+            build: функция (индекс, *args) -> ответ, например LETIScheduleAPI._range_from_index
+            in_thread: собирать ответ в отдельном потоке (для тяжёлой работы)
+        """
+        try:
+            index = await schedule_store.get_index()
+            if in_thread:
+                return await asyncio.to_thread(build, index, *args)
+            return build(index, *args)
+        except ScheduleFetchError as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Ошибка: {str(e)}"
+            }
+    
+    @staticmethod
+    @instrument_api("get_group_schedule_async")
+    async def get_group_schedule(
+        group_number: str,
+        week_type: Optional[str] = None,
+        day: Optional[str] = None
+    ) -> Dict:
+        """
+        Получить расписание группы
+        
+        Args:
+            group_number: номер группы (например '4352')
+            week_type: тип недели ('1' - нечетная, '2' - четная)
+            day: номер дня (0-понедельник, 1-вторник, ...) или название
+        """
+        return await AsyncLETIScheduleAPI._with_index(
+            LETIScheduleAPI.schedule_from_index, group_number, week_type, day
+        )
+    
+    @staticmethod
+    @instrument_api("get_range_schedule_async")
+    async def get_range_schedule(group_number: str, start: Optional[date] = None, days: int = 14) -> Dict:
+        """
+        Расписание группы по датам на несколько недель вперёд
+        
+        Args:
+            start: первый день периода (по умолчанию - сегодня)
+            days: сколько дней показать (не больше MAX_RANGE_DAYS)
+        
+        Returns:
+            Dict: success, group, start, dates - список (дата, неделя, праздник, занятия)
+        """
+        return await AsyncLETIScheduleAPI._with_index(
+            LETIScheduleAPI._range_from_index, group_number, start, days
+        )
+    
+    @staticmethod
+    @instrument_api("get_common_free_slots_async")
+    async def get_common_free_slots(group_numbers: List[str], week_type: Optional[str] = None) -> Dict:
+        """
+        Общие свободные окна нескольких групп (пн-сб, 08:00-20:00)
+        
+        Args:
+            group_numbers: номера групп
+            week_type: '1'/'2' - только эта неделя, None - обе
         
-        return response
\ No newline at end of file
+        Returns:
+            Dict: success, groups, week_type, slots - список (неделя, день, начало, конец)
+        """
+        return await AsyncLETIScheduleAPI._with_index(
+            LETIScheduleAPI._free_slots_from_index, group_numbers, week_type
+        )
+    
+    @staticmethod
+    @instrument_api("find_lessons_by_async")
+    async def find_lessons_by(kind: str, query: str) -> Dict:
+        """
+        Занятия преподавателя или в аудитории (поиск по началу имени)
+        
+        Args:
+            kind: 'teacher' или 'room'
+            query: начало фамилии преподавателя или номера аудитории
+        
+        Returns:
+            Dict: success, kind, matches (найденные имена), name и lessons - если
+            совпадение одно (или точное): список (группа, занятие)
+        """
+        return await AsyncLETIScheduleAPI._with_index(LETIScheduleAPI._lessons_by_from_index, kind, query)
+    
+    @staticmethod
+    @instrument_api("get_group_ics_async")
+    async def get_group_ics(group_number: str) -> Dict:
+        """
+        Расписание группы на текущий семестр в формате iCalendar
+        
+        Returns:
+            Dict: success, group, filename, content (байты .ics)
+        """
+        # Сборка файла - заметная работа для CPU, уносим её из цикла событий
+        return await AsyncLETIScheduleAPI._with_index(
+            LETIScheduleAPI._ics_from_index, group_number, in_thread=True
+        )
+    
+    @staticmethod
+    @instrument_api("get_next_lesson_async")
+    async def get_next_lesson(group_number: str, moment: Optional[datetime] = None) -> Dict:
+        """
+        Ближайшее занятие группы начиная с момента moment (по умолчанию - сейчас)
+        
+        Returns:
+            Dict: success, lesson, days_ahead (через сколько дней), minutes_ahead
+        """
+        return await AsyncLETIScheduleAPI._with_index(
+            LETIScheduleAPI.next_lesson_from_index, group_number, moment
+        )
+
+
+# Учебный календарь: чётность недель с учётом семестров и праздников
+academic_calendar = AcademicCalendar()
+
+# Общее для всего процесса хранилище расписания
+schedule_store = ScheduleStore(f"{LETIScheduleAPI.BASE_URL}/schedule")
+
+# Кэш готовых сообщений; после обновления расписания старые сообщения не нужны
+render_cache = LRUCache(maxsize=512)
+schedule_store.add_refresh_listener(render_cache.clear)
@@ -0,0 +1,86 @@
+"""
+Массовая рассылка сообщений с учётом ограничений Telegram.
+
+Telegram допускает около 30 сообщений в секунду от одного бота,
+поэтому сообщения отправляются пачками не больше rate штук в секунду.
+Пачка уходит параллельно, а при ответе 429 (RetryAfter) отправка
+повторяется после указанной паузы.
+"""
+
+import asyncio
+import logging
+from typing import Callable, Iterable, Optional, Tuple
+
+from telegram import Bot
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+
+class BatchSender:
+    """Рассылка сообщений пачками с ограничением скорости"""
+
+    DEFAULT_RATE = 25   # сообщений в секунду, с запасом до лимита Telegram
+    MAX_RETRIES = 3
+
+    def __init__(
+        self,
+        bot: Bot,
+        rate: int = DEFAULT_RATE,
+        on_forbidden: Optional[Callable[[int], None]] = None
+    ):
+        """
+        Args:
+            bot: бот, от имени которого идёт рассылка
+            rate: сколько сообщений отправлять в секунду
+            on_forbidden: вызывается с chat_id, если бот заблокирован в чате
+        """
+        self.bot = bot
+        self.rate = rate
+        self.on_forbidden = on_forbidden
+
+    async def send_many(self, messages: Iterable[Tuple[int, str]], parse_mode: str = 'Markdown') -> Tuple[int, int]:
+        """
+        Отправить сообщения (chat_id, текст)
+
+        Returns:
+            (сколько отправлено, сколько не удалось отправить)
+        """
+        messages = list(messages)
+        sent = 0
+        loop = asyncio.get_running_loop()
+
+        for start in range(0, len(messages), self.rate):
+            batch = messages[start:start + self.rate]
+            batch_started = loop.time()
+
+            results = await asyncio.gather(*[
+                self._send(chat_id, text, parse_mode) for chat_id, text in batch
+            ])
+            sent += sum(results)
+
+            # Следующая пачка - не раньше чем через секунду после начала этой
+            if start + self.rate < len(messages):
+                await asyncio.sleep(max(0.0, 1.0 - (loop.time() - batch_started)))
+
+        return sent, len(messages) - sent
+
+    async def _send(self, chat_id: int, text: str, parse_mode: str) -> bool:
+        for _ in range(self.MAX_RETRIES):
+            try:
+                await self.bot.send_message(chat_id, text, parse_mode=parse_mode)
+                return True
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+                logger.warning(f"Telegram просит подождать {retry_after} с перед отправкой в чат {chat_id}")
+                await asyncio.sleep(retry_after)
+            except Forbidden:
+                # Бота заблокировали или удалили из чата
+                if self.on_forbidden:
+                    self.on_forbidden(chat_id)
+                return False
+            except TelegramError as e:
+                logger.warning(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
+                return False
+
+        return False
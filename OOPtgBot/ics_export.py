@@ -0,0 +1,180 @@
+"""
+Экспорт расписания группы в iCalendar (.ics).
+
+Каждое занятие - одно повторяющееся событие (RRULE): раз в неделю, если
+занятие идёт каждую неделю, или раз в две недели для нечётной/чётной недели.
+Даты, которые расходятся с учебным календарём (праздники, недели с заданной
+вручную чётностью), исключаются через EXDATE и добавляются через RDATE,
+так что календарь совпадает с тем, что показывает бот.
+"""
+
+import hashlib
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List, Tuple
+
+from academic_calendar import AcademicCalendar
+from lesson import Lesson
+
+TIMEZONE = "Europe/Moscow"
+
+# Москва живёт в UTC+3 без перехода на летнее время
+VTIMEZONE = [
+    "BEGIN:VTIMEZONE",
+    f"TZID:{TIMEZONE}",
+    "BEGIN:STANDARD",
+    "DTSTART:19700101T000000",
+    "TZOFFSETFROM:+0300",
+    "TZOFFSETTO:+0300",
+    "TZNAME:MSK",
+    "END:STANDARD",
+    "END:VTIMEZONE",
+]
+
+
+def _escape(text: str) -> str:
+    """Экранирование текстовых значений по RFC 5545"""
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Перенос строк длиннее 75 байт (продолжение начинается с пробела)"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+
+    parts = []
+    current = ""
+    size = 0
+    limit = 75
+    for char in line:
+        char_size = len(char.encode("utf-8"))
+        if size + char_size > limit:
+            parts.append(current)
+            current, size, limit = "", 0, 74  # у продолжения один байт занимает пробел
+        current += char
+        size += char_size
+    parts.append(current)
+    return "\r\n ".join(parts)
+
+
+class IcsExport:
+    """Сборка .ics-файла по занятиям группы и учебному календарю"""
+
+    PRODID = "-//LETI schedule bot//RU"
+
+    @staticmethod
+    def build(
+        group_number: str,
+        lessons: Iterable[Lesson],
+        calendar: AcademicCalendar,
+        semester: Tuple[date, date]
+    ) -> bytes:
+        """
+        Собрать календарь группы на семестр
+
+        Args:
+            lessons: занятия группы из индекса
+            calendar: учебный календарь (чётность недель и праздники)
+            semester: (первый, последний) день семестра
+        """
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        lines = [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            f"PRODID:{IcsExport.PRODID}",
+            "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH",
+            f"X-WR-CALNAME:{_escape(f'Расписание {group_number}')}",
+            f"X-WR-TIMEZONE:{TIMEZONE}",
+            *VTIMEZONE,
+        ]
+
+        for lesson in lessons:
+            lines.extend(IcsExport._event(group_number, lesson, calendar, semester, stamp))
+
+        lines.append("END:VCALENDAR")
+        return ("\r\n".join(_fold(line) for line in lines) + "\r\n").encode("utf-8")
+
+    @staticmethod
+    def _occurrences(lesson: Lesson, calendar: AcademicCalendar, semester: Tuple[date, date]) -> List[date]:
+        """Дни семестра, в которые занятие действительно проходит"""
+        first, last = semester
+        day = first + timedelta(days=(lesson.day - first.weekday()) % 7)
+
+        dates = []
+        while day <= last:
+            right_week = lesson.week not in ("1", "2") or calendar.week_type(day) == lesson.week
+            if right_week and not calendar.is_holiday(day):
+                dates.append(day)
+            day += timedelta(days=7)
+        return dates
+
+    @staticmethod
+    def _event(
+        group_number: str,
+        lesson: Lesson,
+        calendar: AcademicCalendar,
+        semester: Tuple[date, date],
+        stamp: str
+    ) -> List[str]:
+        if lesson.start is None or lesson.day == Lesson.UNKNOWN_DAY:
+            return []
+
+        dates = IcsExport._occurrences(lesson, calendar, semester)
+        if not dates:
+            return []
+
+        # Правило повторения от первого занятия; расхождения с календарём - EXDATE/RDATE
+        interval = 1 if lesson.week not in ("1", "2") else 2
+        until = semester[1]
+        generated = set()
+        day = dates[0]
+        while day <= until:
+            generated.add(day)
+            day += timedelta(days=7 * interval)
+
+        actual = set(dates)
+        start_time = lesson.start_time.replace(":", "") + "00"
+        end_minutes = lesson.end if lesson.end is not None else lesson.start + 90
+        end_time = Lesson.format_minutes(end_minutes).replace(":", "") + "00"
+
+        uid_source = f"{group_number}|{lesson.key()}"
+        uid = hashlib.sha1(uid_source.encode("utf-8")).hexdigest()
+
+        summary = lesson.name or "Занятие"
+        if lesson.subject_type:
+            summary += f" ({lesson.subject_type})"
+
+        description = [f"Группа {group_number}"]
+        if lesson.teacher:
+            description.append(f"Преподаватель: {lesson.teacher}")
+        if lesson.week in ("1", "2"):
+            description.append("Нечетная неделя" if lesson.week == "1" else "Четная неделя")
+
+        event = [
+            "BEGIN:VEVENT",
+            f"UID:{uid}@leti-schedule-bot",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART;TZID={TIMEZONE}:{dates[0]:%Y%m%d}T{start_time}",
+            f"DTEND;TZID={TIMEZONE}:{dates[0]:%Y%m%d}T{end_time}",
+            f"RRULE:FREQ=WEEKLY;INTERVAL={interval};UNTIL={until:%Y%m%d}T235959Z",
+            f"SUMMARY:{_escape(summary)}",
+            f"DESCRIPTION:{_escape(chr(10).join(description))}",
+        ]
+        if lesson.room or lesson.form:
+            event.append(f"LOCATION:{_escape(lesson.room or lesson.form)}")
+
+        excluded = sorted(generated - actual)
+        if excluded:
+            event.append(f"EXDATE;TZID={TIMEZONE}:" + ",".join(f"{d:%Y%m%d}T{start_time}" for d in excluded))
+        extra = sorted(actual - generated)
+        if extra:
+            event.append(f"RDATE;TZID={TIMEZONE}:" + ",".join(f"{d:%Y%m%d}T{start_time}" for d in extra))
+
+        event.append("END:VEVENT")
+        return event
@@ -0,0 +1,126 @@
+"""
+Компактная запись об одном занятии.
+
+Вместо словаря из ответа API (с повторяющимися строковыми ключами у каждого
+занятия) хранится объект со __slots__. Строки, которые повторяются у многих
+занятий (преподаватель, аудитория, предмет, день), интернируются и хранятся
+в памяти в одном экземпляре, а время начала и конца - целые минуты от начала суток.
+"""
+
+import sys
+from typing import Dict, Optional, Tuple
+
+
+def _intern(value) -> str:
+    return sys.intern(str(value)) if value else ""
+
+
+def _parse_minutes(value) -> Optional[int]:
+    """'08:00' -> 480; None, если время не распознано"""
+    try:
+        h, m = map(int, str(value).split(":")[:2])
+        return h * 60 + m
+    except ValueError:
+        return None
+
+
+class Lesson:
+    """Одно занятие группы"""
+
+    __slots__ = (
+        "day", "day_name", "week", "start", "end",
+        "name", "subject_type", "teacher", "room", "form"
+    )
+
+    UNKNOWN_DAY = 7  # день не распознан - такие занятия идут в конце
+
+    def __init__(
+        self,
+        day: int,
+        day_name: str,
+        week: str,
+        start: Optional[int],
+        end: Optional[int],
+        name: str,
+        subject_type: str = "",
+        teacher: str = "",
+        room: str = "",
+        form: str = ""
+    ):
+        self.day = day
+        self.day_name = day_name
+        self.week = week
+        self.start = start
+        self.end = end
+        self.name = name
+        self.subject_type = subject_type
+        self.teacher = teacher
+        self.room = room
+        self.form = form
+
+    @classmethod
+    def from_api(cls, lesson: Dict, day_number: str, day_name: str) -> "Lesson":
+        """Создать занятие из словаря ответа /schedule"""
+        start = _parse_minutes(lesson.get("start_time"))
+        if start is None and isinstance(lesson.get("start_time_seconds"), int):
+            start = lesson["start_time_seconds"] // 60
+
+        return cls(
+            day=int(day_number) if str(day_number).isdigit() else cls.UNKNOWN_DAY,
+            day_name=_intern(day_name),
+            week=_intern(lesson.get("week", "")),
+            start=start,
+            end=_parse_minutes(lesson.get("end_time")),
+            name=_intern(lesson.get("name", "")),
+            subject_type=_intern(lesson.get("subjectType", "")),
+            teacher=_intern(lesson.get("teacher", "")),
+            room=_intern(lesson.get("room", "")),
+            form=_intern(lesson.get("form", ""))
+        )
+
+    def to_api(self) -> Dict:
+        """Словарь в формате занятия из ответа /schedule (для снимка на диске)"""
+        lesson = {
+            "week": self.week,
+            "name": self.name,
+            "subjectType": self.subject_type,
+            "teacher": self.teacher,
+            "room": self.room,
+            "form": self.form
+        }
+        if self.start is not None:
+            lesson["start_time"] = self.start_time
+        if self.end is not None:
+            lesson["end_time"] = self.end_time
+        return lesson
+
+    @staticmethod
+    def format_minutes(minutes: Optional[int]) -> str:
+        if minutes is None:
+            return "??:??"
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+    @property
+    def start_time(self) -> str:
+        """Время начала в виде 'ЧЧ:ММ'"""
+        return self.format_minutes(self.start)
+
+    @property
+    def end_time(self) -> str:
+        """Время окончания в виде 'ЧЧ:ММ'"""
+        return self.format_minutes(self.end)
+
+    @property
+    def sort_key(self) -> Tuple[int, int]:
+        """Порядок в расписании: день, затем время начала"""
+        return self.day, self.start if self.start is not None else 0
+
+    def key(self) -> Tuple:
+        """Поля, по которым два занятия считаются одинаковыми"""
+        return (
+            self.day, self.week, self.start, self.end, self.name,
+            self.subject_type, self.teacher, self.room, self.form
+        )
+
+    def __repr__(self) -> str:
+        return f"Lesson({self.day_name} {self.start_time}, неделя {self.week}: {self.name})"
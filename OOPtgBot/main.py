@@ -1,10 +1,30 @@
+import io
 import os
+import time
+import asyncio
 import logging
 from datetime import datetime
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram import (
+    Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup,
+    InlineQueryResultArticle, InputTextMessageContent, InputFile
+)
+from telegram.error import BadRequest
+from telegram.helpers import escape_markdown
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, InlineQueryHandler, CallbackQueryHandler, filters, ContextTypes
+)
 from dotenv import load_dotenv
-from api_client import LETIScheduleAPI
+from api_client import LETIScheduleAPI, AsyncLETIScheduleAPI, schedule_store, academic_calendar, render_cache
+from schedule_store import ScheduleStore
+from academic_calendar import AcademicCalendar
+from schedule_changes import ScheduleChanges
+from subscriptions import SubscriptionStore
+from preferences import PreferencesStore
+from batch_sender import BatchSender
+import metrics
+from metrics import MetricsServer
+from webhook_server import WebhookServer, run_webhook
+from update_processor import PerChatUpdateProcessor
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -22,6 +42,47 @@ if not TOKEN:
     logger.error("Токен бота не найден! Проверьте файл .env")
     exit(1)
 
+# Подписки чатов на уведомления
+subscriptions = SubscriptionStore()
+
+# Группы чатов по умолчанию
+preferences = PreferencesStore()
+
+# Подсказка для команд, вызванных без группы
+GROUP_HINT = "\nИли выберите группу по умолчанию: `/group 4341`"
+
+# Время ежедневной рассылки, если пользователь его не указал
+DEFAULT_DIGEST_TIME = "20:00"
+
+# Сколько пропущенных минут рассылки досылать (если цикл событий был занят или бот подвис)
+DIGEST_CATCHUP_MINUTES = 15
+
+# Локальный HTTP-сервер метрик (/metrics)
+metrics_server = MetricsServer()
+
+# Слова inline-запроса (@бот 4352 завтра) -> вид ответа
+INLINE_KINDS = {
+    "сегодня": "today", "today": "today",
+    "завтра": "tomorrow", "tomorrow": "tomorrow",
+    "ближайшая": "near", "пара": "near", "near": "near",
+    "неделя": "week", "week": "week"
+}
+INLINE_TITLES = {
+    "today": "📅 Сегодня",
+    "tomorrow": "⏭️ Завтра",
+    "near": "🔍 Ближайшее занятие",
+    "week": "📋 Вся неделя"
+}
+
+# Слова, которыми в /free задаётся неделя (остальные аргументы - группы)
+FREE_WEEK_WORDS = {"1", "2", "odd", "even", "нечетная", "четная", "нечет", "чет"}
+
+# Длина периода /range по умолчанию, в днях
+DEFAULT_RANGE_DAYS = 14
+
+# Группы, которые /testapi проверяет, если они не указаны
+DEFAULT_TEST_GROUPS = ['4341', '3301', '2302', '1381', '4301']
+
 # Главное меню
 def get_main_keyboard():
     keyboard = [
@@ -49,6 +110,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /week [группа] — расписание на всю неделю
 /day [день] [неделя] [группа] — расписание на конкретный день
 /near [группа] — ближайшее занятие
+/range [группа] [дней] — расписание по датам на несколько недель
+/free группа1 группа2 ... — общие свободные окна нескольких групп
+/teacher фамилия — расписание преподавателя
+/room аудитория — занятия в аудитории
+/ics [группа] — файл расписания для календаря (Google, Apple, Outlook)
+/group [группа] — группа по умолчанию для команд без номера группы
+/subscribe [группа] — уведомлять об изменениях расписания
+/digest [группа] [ЧЧ:ММ] — присылать расписание на завтра каждый день
 
 *Примеры использования:*
 /today 4352
@@ -87,6 +156,19 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 *Расширенные команды:*
 `/day [день] [неделя] [группа]` - конкретный день
 `/near [группа]` - ближайшая пара
+`/range [группа] [дней] [с ДД.ММ]` - расписание по датам (по умолчанию 14 дней с сегодня)
+`/free группа1 группа2 ... [неделя]` - когда все группы свободны одновременно
+`/teacher фамилия` - расписание преподавателя (можно начало фамилии)
+`/room аудитория` - занятия в аудитории (можно начало номера)
+`/ics [группа]` - расписание на семестр файлом .ics для импорта в календарь
+`/group [группа]` - запомнить группу, тогда номер в командах можно не указывать
+`/group off` - забыть группу
+
+*Уведомления:*
+`/subscribe [группа]` - сообщать об изменениях расписания группы
+`/unsubscribe [группа]` - отписаться (без группы - от всех)
+`/digest [группа] [ЧЧ:ММ]` - каждый день присылать расписание на завтра (по умолчанию в 20:00)
+`/digest off` - отключить ежедневную рассылку
 
 *Кнопки меню:*
 • 📅 Сегодня - расписание на сегодня
@@ -111,12 +193,11 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # Команда /today
 async def today_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Расписание на сегодня"""
-    if not context.args:
-        await update.message.reply_text("Укажите номер группы. Пример: `/today 4341`", parse_mode='Markdown')
+    group = group_for_chat(update, context.args[0] if context.args else None)
+    if not group:
+        await update.message.reply_text("Укажите номер группы. Пример: `/today 4341`" + GROUP_HINT, parse_mode='Markdown')
         return
     
-    group = context.args[0]
-    
     # Получаем текущую неделю
     week_type = LETIScheduleAPI.determine_current_week()  # "1" или "2"
     
@@ -140,12 +221,17 @@ async def today_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"🔍 Ищу: группа {group}, день '{day_for_api}', неделя {week_type}")
     
     # Получаем расписание
-    schedule = LETIScheduleAPI.get_group_schedule(group, week_type, day_for_api)
+    schedule = await AsyncLETIScheduleAPI.get_group_schedule(group, week_type, day_for_api)
+    
+    # Группа не найдена или сервер недоступен - сообщение об ошибке с подсказками
+    if not schedule["success"]:
+        await update.message.reply_text(LETIScheduleAPI.format_schedule_for_display(schedule))
+        return
     
     # Если не нашли - пробуем без фильтра по неделе (все недели)
     if schedule["total_lessons"] == 0:
         print(f"⚠️ Не найдено на неделе {week_type}, ищу на всех неделях")
-        schedule = LETIScheduleAPI.get_group_schedule(group, None, day_for_api)
+        schedule = await AsyncLETIScheduleAPI.get_group_schedule(group, None, day_for_api)
     
     # Форматируем и отправляем
     formatted = LETIScheduleAPI.format_schedule_for_display(schedule)
@@ -155,19 +241,21 @@ async def today_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
         week_text = "четной" if week_type == "2" else "нечетной"
         formatted = f"📅 *На сегодня ({day_for_api.lower()}, {week_text} неделя) пар нет*\n\n" + formatted
     
+    if academic_calendar.is_holiday(datetime.now()):
+        formatted = "🎉 *Сегодня праздничный день по учебному календарю*\n\n" + formatted
+    
     await update.message.reply_text(formatted, parse_mode='Markdown')
 
 # Команда /week
 async def week_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Расписание на всю неделю"""
-    if not context.args:
+    group = group_for_chat(update, context.args[0] if context.args else None)
+    if not group:
         await update.message.reply_text(
-            "Укажите номер группы.\nПример: `/week 4341`",
+            "Укажите номер группы.\nПример: `/week 4341`" + GROUP_HINT,
             parse_mode='Markdown'
         )
         return
-    
-    group = context.args[0]
     week_type = LETIScheduleAPI.determine_current_week()
     
     week_ru = "нечетная неделя" if week_type == "odd_week" else "четная неделя"
@@ -179,31 +267,32 @@ async def week_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     # Получаем расписание без фильтра по дню
-    schedule = LETIScheduleAPI.get_group_schedule(group, week_type)
+    schedule = await AsyncLETIScheduleAPI.get_group_schedule(group, week_type)
     
-    # Форматируем и отправляем
-    formatted = LETIScheduleAPI.format_schedule_for_display(schedule)
-    
-    # Если много текста, разбиваем на части
-    if len(formatted) > 4000:
-        parts = [formatted[i:i+4000] for i in range(0, len(formatted), 4000)]
-        for part in parts:
-            await update.message.reply_text(part, parse_mode='Markdown')
-    else:
-        await update.message.reply_text(formatted, parse_mode='Markdown')
+    # Страницы режутся по границам дней и кэшируются; дальше - листание кнопками
+    pages = LETIScheduleAPI.format_schedule_pages(schedule)
+    await update.message.reply_text(
+        pages[0],
+        parse_mode='Markdown',
+        reply_markup=get_pages_keyboard(f"w:{group}:{week_type}", 0, len(pages))
+    )
     
 # Команда /tomorrow
 async def tomorrow_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Расписание на завтра"""
-    if not context.args:
+    group = group_for_chat(update, context.args[0] if context.args else None)
+    if not group:
         await update.message.reply_text(
-            "Укажите номер группы.\nПример: `/tomorrow 4352`",
+            "Укажите номер группы.\nПример: `/tomorrow 4352`" + GROUP_HINT,
             parse_mode='Markdown'
         )
         return
+    response = await tomorrow_message(group)
     
-    group = context.args[0]
-    
+    await update.message.reply_text(response, parse_mode='Markdown')
+
+async def tomorrow_message(group: str) -> str:
+    """Текст расписания группы на завтра (для /tomorrow и ежедневной рассылки)"""
     from datetime import datetime, timedelta
     
     # Определяем завтра
@@ -223,7 +312,7 @@ async def tomorrow_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     day_for_api = days[tomorrow_num]
     
     # Получаем расписание
-    schedule = LETIScheduleAPI.get_group_schedule(group, week_type, day_for_api)
+    schedule = await AsyncLETIScheduleAPI.get_group_schedule(group, week_type, day_for_api)
     
     # Форматируем
     formatted = LETIScheduleAPI.format_schedule_for_display(schedule)
@@ -231,16 +320,21 @@ async def tomorrow_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Добавляем заголовок
     day_ru = day_for_api.lower().capitalize()
     week_name = "нечетной" if week_type == "1" else "четной"
-    response = f"📅 *Расписание на завтра ({day_ru}, {week_name} неделя)*\n\n{formatted}"
-    
-    await update.message.reply_text(response, parse_mode='Markdown')
-    
+    if academic_calendar.is_holiday(tomorrow):
+        formatted = "🎉 *Праздничный день по учебному календарю*\n\n" + formatted
+    return f"📅 *Расписание на завтра ({day_ru}, {week_name} неделя)*\n\n{formatted}"
+
 # Команда /day
 async def day_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Расписание на конкретный день и неделю"""
-    if len(context.args) < 3:
+    group = None
+    if len(context.args) >= 2:
+        group = group_for_chat(update, context.args[2] if len(context.args) > 2 else None)
+    
+    if not group:
         await update.message.reply_text(
-            "Используйте: `/day ДЕНЬ НЕДЕЛЯ ГРУППА`\n\n"
+            "Используйте: `/day ДЕНЬ НЕДЕЛЯ [ГРУППА]`\n"
+            "(группу можно не указывать, если она выбрана через /group)\n\n"
             "*Примеры:*\n"
             "`/day monday odd 4352`\n"
             "`/day вторник четная 4352`\n"
@@ -253,7 +347,6 @@ async def day_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     day_input = context.args[0]
     week_input = context.args[1]
-    group = context.args[2]
     
     # Нормализуем день
     day_normalized = LETIScheduleAPI.normalize_day_name(day_input)
@@ -264,7 +357,7 @@ async def day_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"🔍 Запрос: день='{day_normalized}', неделя='{week_normalized}', группа='{group}'")
     
     # Получаем расписание
-    schedule = LETIScheduleAPI.get_group_schedule(group, week_normalized, day_normalized)
+    schedule = await AsyncLETIScheduleAPI.get_group_schedule(group, week_normalized, day_normalized)
     
     # Форматируем
     formatted = LETIScheduleAPI.format_schedule_for_display(schedule)
@@ -279,173 +372,656 @@ async def day_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # Команда /near
 async def near_lesson(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ближайшее занятие"""
-    if not context.args:
-        await update.message.reply_text("Укажите номер группы. Пример: `/near 4352`", parse_mode='Markdown')
+    group = group_for_chat(update, context.args[0] if context.args else None)
+    if not group:
+        await update.message.reply_text("Укажите номер группы. Пример: `/near 4352`" + GROUP_HINT, parse_mode='Markdown')
         return
     
-    group = context.args[0]
+    # Поиск по готовой ленте занятий группы (обе чётности недели)
+    result = await AsyncLETIScheduleAPI.get_next_lesson(group)
     
-    from datetime import datetime, timedelta
+    if not result["success"]:
+        await update.message.reply_text(f"❌ {result['error']}")
+        return
     
-    # Получаем текущее время
-    now = datetime.now()
-    current_time_str = now.strftime("%H:%M")
-    current_weekday = now.weekday()  # 0=понедельник
+    await update.message.reply_text(next_lesson_message(group, result), parse_mode='Markdown')
+
+def next_lesson_message(group: str, result: dict) -> str:
+    """Текст о ближайшем занятии (для /near и inline-режима)"""
+    nearest_lesson = result["lesson"]
+    if nearest_lesson is None:
+        return f"📭 У группы {group} нет занятий в расписании."
     
-    # Преобразуем строку времени в минуты для сравнения
-    def time_to_minutes(time_str):
-        try:
-            h, m = map(int, time_str.split(':'))
-            return h * 60 + m
-        except:
-            return 0
+    # Форматируем ответ
+    days_ahead = result["days_ahead"]
+    day_name = nearest_lesson.day_name.lower().capitalize()
+    time_start = nearest_lesson.start_time
+    time_end = nearest_lesson.end_time
+    subject = nearest_lesson.name or "Не указано"
+    room = nearest_lesson.room
+    teacher = nearest_lesson.teacher
+    lesson_week = nearest_lesson.week
+    
+    # Определяем когда
+    if days_ahead == 0:
+        when = "Сегодня"
+    elif days_ahead == 1:
+        when = "Завтра"
+    else:
+        when = f"Через {days_ahead} дня(ей)"
     
-    current_minutes = time_to_minutes(current_time_str)
+    response = (
+        f"🔍 *Ближайшее занятие для группы {group}:*\n\n"
+        f"📅 *{when} ({day_name})*\n"
+        f"🕐 *{time_start}-{time_end}*\n"
+        f"📚 {subject}\n"
+    )
     
-    # Определяем текущую неделю
-    week_type = LETIScheduleAPI.determine_current_week()
+    if teacher:
+        response += f"👨‍🏫 {teacher}\n"
     
-    # Получаем все занятия на этой неделе
-    schedule = LETIScheduleAPI.get_group_schedule(group, week_type)
+    if room:
+        response += f"🚪 {room}\n"
     
-    if not schedule["success"] or schedule["total_lessons"] == 0:
-        await update.message.reply_text(f"📭 У группы {group} нет занятий на этой неделе.")
-        return
+    if lesson_week in ("1", "2"):
+        response += f"📆 {'Нечетная' if lesson_week == '1' else 'Четная'} неделя"
     
-    # Дни недели в формате API (ЗАГЛАВНЫЕ русские)
-    days_api_format = ["ПОНЕДЕЛЬНИК", "ВТОРНИК", "СРЕДА", "ЧЕТВЕРГ", "ПЯТНИЦА", "СУББОТА", "ВОСКРЕСЕНЬЕ"]
-    today_name_api = days_api_format[current_weekday]
+    return response
+
+# Команда /range
+async def range_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Расписание по датам на несколько недель вперёд
     
-    # Ищем ближайшее занятие
-    nearest_lesson = None
-    min_days_ahead = 7  # Максимум неделя вперед
-    min_time_diff = 24 * 60  # Максимум 24 часа в минутах
+    /range [группа] [дней] [с ДД.ММ] - по умолчанию 14 дней начиная с сегодня
+    """
+    group_arg = None
+    days = DEFAULT_RANGE_DAYS
+    start = datetime.now().date()
     
-    for lesson in schedule["lessons"]:
-        lesson_day = lesson.get("day_name", "")  # В формате "ПОНЕДЕЛЬНИК"
-        lesson_time_str = lesson.get("start_time", "00:00")
-        lesson_minutes = time_to_minutes(lesson_time_str)
-        
-        # Находим индекс дня занятия
-        try:
-            lesson_day_index = days_api_format.index(lesson_day)
-        except ValueError:
-            # Если день в другом формате, пробуем нормализовать
-            normalized_day = LETIScheduleAPI.normalize_day_name(lesson_day)
+    for arg in context.args:
+        if "." in arg:
+            date_text = arg if arg.count(".") == 2 else f"{arg}.{start.year}"
             try:
-                lesson_day_index = days_api_format.index(normalized_day)
-            except:
-                continue  # Пропускаем если не распознали день
-        
-        # Вычисляем разницу в днях
-        days_diff = lesson_day_index - current_weekday
-        if days_diff < 0:
-            days_diff += 7  # Занятие на следующей неделе
-        
-        # Вычисляем разницу во времени
-        if days_diff == 0:
-            # Сегодня
-            time_diff = lesson_minutes - current_minutes
-            if time_diff < 0:
-                continue  # Занятие уже прошло сегодня
+                parsed = datetime.strptime(date_text, "%d.%m.%Y")
+            except ValueError:
+                await update.message.reply_text("❌ Дату нужно указать как ДД.ММ или ДД.ММ.ГГГГ")
+                return
+            start = parsed.date()
+        elif arg.isdigit() and len(arg) <= 2:
+            days = int(arg)
         else:
-            # Не сегодня
-            time_diff = days_diff * 24 * 60 + lesson_minutes
+            group_arg = arg
+    
+    group = group_for_chat(update, group_arg)
+    if not group:
+        await update.message.reply_text(
+            "Укажите номер группы.\nПример: `/range 4352 14` или `/range 4352 21 01.12`" + GROUP_HINT,
+            parse_mode='Markdown'
+        )
+        return
+    
+    schedule = await AsyncLETIScheduleAPI.get_range_schedule(group, start, days)
+    if not schedule["success"]:
+        # Номер ненайденной группы введён пользователем - экранируем его для Markdown
+        await update.message.reply_text(f"❌ {escape_markdown(schedule['error'])}", parse_mode='Markdown')
+        return
+    
+    pages = LETIScheduleAPI.format_range_for_display(schedule)
+    await update.message.reply_text(
+        pages[0],
+        parse_mode='Markdown',
+        reply_markup=get_pages_keyboard(f"r:{group}:{start:%Y%m%d}:{days}", 0, len(pages))
+    )
+
+# Листание страниц кнопками
+async def page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Кнопки ◀️ / ▶️ под длинным расписанием
+    
+    callback_data: "pg:w:группа:неделя:страница" или "pg:r:группа:ГГГГММДД:дней:страница".
+    Страницы берутся из кэша готовых сообщений, расписание не перерисовывается.
+    """
+    query = update.callback_query
+    _, kind, *params, page = query.data.split(":")
+    page = int(page)
+    
+    if kind == "w":
+        group, week_type = params
+        schedule = await AsyncLETIScheduleAPI.get_group_schedule(group, week_type)
+        pages = LETIScheduleAPI.format_schedule_pages(schedule)
+    else:
+        group, start, days = params
+        start = datetime.strptime(start, "%Y%m%d").date()
+        schedule = await AsyncLETIScheduleAPI.get_range_schedule(group, start, int(days))
+        pages = LETIScheduleAPI.format_range_for_display(schedule)
+    
+    # После обновления расписания страниц могло стать меньше
+    page = min(page, len(pages) - 1)
+    await query.answer()
+    
+    try:
+        await query.edit_message_text(
+            pages[page],
+            parse_mode='Markdown',
+            reply_markup=get_pages_keyboard(":".join([kind, *params]), page, len(pages))
+        )
+    except BadRequest as e:
+        # Повторное нажатие на ту же страницу - текст не изменился
+        if "not modified" not in str(e).lower():
+            raise
+
+# Inline-режим
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Ответ на inline-запрос `@бот 4352 завтра` из любого чата
+    
+    Ответ собирается только из индекса в памяти и кэша готовых сообщений:
+    если расписание ещё не загружено, бот не ждёт сервер, а отвечает пустым списком.
+    """
+    query = update.inline_query
+    words = query.query.strip().lower().split()
+    index = schedule_store.current_index()
+    
+    group = next((word for word in words if word.isdigit()), None)
+    personal = group is None
+    if group is None:
+        group = preferences.default_group(query.from_user.id)
+    
+    if index is None or not group or not index.has_group(group):
+        await query.answer([], cache_time=5, is_personal=True)
+        return
+    
+    kinds = [INLINE_KINDS[word] for word in words if word in INLINE_KINDS]
+    if not kinds:
+        kinds = ["today", "tomorrow", "near", "week"]
+    
+    now = datetime.now()
+    results = []
+    for kind in dict.fromkeys(kinds):
+        text = inline_text(index, group, kind, now)
+        results.append(InlineQueryResultArticle(
+            id=f"{group}:{kind}:{index.version}",
+            title=f"{INLINE_TITLES[kind]} — группа {group}",
+            description=text.split("\n", 2)[-1][:100].replace("*", ""),
+            input_message_content=InputTextMessageContent(text, parse_mode='Markdown')
+        ))
+    
+    # Ответ для группы по умолчанию у каждого пользователя свой
+    await query.answer(results, cache_time=60, is_personal=personal)
+
+def inline_text(index, group: str, kind: str, now: datetime) -> str:
+    """Текст inline-ответа по готовому индексу (без запросов к API)"""
+    from datetime import timedelta
+    
+    if kind == "near":
+        return next_lesson_message(group, LETIScheduleAPI.next_lesson_from_index(index, group, now))
+    
+    if kind == "week":
+        week_type = academic_calendar.week_type(now)
+        schedule = LETIScheduleAPI.schedule_from_index(index, group, week_type)
+        text = LETIScheduleAPI.format_schedule_for_display(schedule)
+    else:
+        day = now if kind == "today" else now + timedelta(days=1)
+        if kind == "tomorrow" and day.weekday() == 6:
+            day += timedelta(days=1)  # как в /tomorrow: после субботы - понедельник
         
-        # Проверяем, ближе ли это занятие
-        if time_diff < min_time_diff or (time_diff == min_time_diff and days_diff < min_days_ahead):
-            min_time_diff = time_diff
-            min_days_ahead = days_diff
-            nearest_lesson = lesson
+        week_type = academic_calendar.week_type(day)
+        schedule = LETIScheduleAPI.schedule_from_index(index, group, week_type, str(day.weekday()))
+        week_name = "нечетная" if week_type == "1" else "четная"
+        day_name = LETIScheduleAPI.DAY_NAMES[day.weekday()].lower().capitalize()
+        title = "Сегодня" if kind == "today" else "Завтра"
+        text = (
+            f"📅 *{title}: {day_name}, {day:%d.%m} ({week_name} неделя)*\n\n"
+            + LETIScheduleAPI.format_schedule_for_display(schedule)
+        )
     
-    # Форматируем ответ
-    if nearest_lesson:
-        day_name = nearest_lesson.get("day_name", "").lower().capitalize()
-        time_start = nearest_lesson.get("start_time", "??:??")
-        time_end = nearest_lesson.get("end_time", "??:??")
-        subject = nearest_lesson.get("name", "Не указано")
-        room = nearest_lesson.get("room", "")
-        teacher = nearest_lesson.get("teacher", "")
-        
-        # Определяем когда
-        if min_days_ahead == 0:
-            when = "Сегодня"
-        elif min_days_ahead == 1:
-            when = "Завтра"
+    # В inline-ответе одно сообщение - длинную неделю обрезаем по границе строки
+    footer = f"\n… полностью: /week {group}"
+    pages = LETIScheduleAPI.paginate("", [text], LETIScheduleAPI.MESSAGE_LIMIT - len(footer))
+    if len(pages) > 1:
+        return pages[0] + footer
+    return text
+
+# Команда /free
+async def free_slots_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Общие свободные окна нескольких групп
+    
+    /free группа1 группа2 ... [неделя] - неделя: нечетная/четная/odd/even/1/2, без неё - обе
+    """
+    groups = []
+    week_type = None
+    for arg in context.args:
+        if arg.lower() in FREE_WEEK_WORDS:
+            week_type = LETIScheduleAPI.normalize_week_type(arg)
         else:
-            when = f"Через {min_days_ahead} дня(ей)"
-        
-        response = (
-            f"🔍 *Ближайшее занятие для группы {group}:*\n\n"
-            f"📅 *{when} ({day_name})*\n"
-            f"🕐 *{time_start}-{time_end}*\n"
-            f"📚 {subject}\n"
+            groups.append(arg)
+    
+    if not groups:
+        await update.message.reply_text(
+            "Укажите номера групп.\nПример: `/free 4341 4342 4343` или `/free 4341 4342 четная`",
+            parse_mode='Markdown'
         )
-        
-        if teacher:
-            response += f"👨‍🏫 {teacher}\n"
-        
-        if room:
-            response += f"🚪 {room}\n"
-        
-        response += f"📆 {'Нечетная' if week_type == '1' else 'Четная'} неделя"
-        
+        return
+    
+    # Группа чата по умолчанию участвует в поиске, если указана только одна группа
+    default = preferences.default_group(update.effective_chat.id)
+    if len(groups) == 1 and default and default != groups[0]:
+        groups.insert(0, default)
+    
+    result = await AsyncLETIScheduleAPI.get_common_free_slots(list(dict.fromkeys(groups)), week_type)
+    if not result["success"]:
+        # Номер ненайденной группы введён пользователем - экранируем его для Markdown
+        await update.message.reply_text(f"❌ {escape_markdown(result['error'])}", parse_mode='Markdown')
+        return
+    
+    pages = LETIScheduleAPI.paginate("", [LETIScheduleAPI.format_free_slots(result)])
+    for page in pages:
+        await update.message.reply_text(page, parse_mode='Markdown')
+
+# Команды /teacher и /room
+async def teacher_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Расписание преподавателя по началу фамилии"""
+    await lessons_by_command(update, context, "teacher", "Пример: `/teacher Иванов`")
+
+async def room_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Занятия в аудитории по номеру или его началу"""
+    await lessons_by_command(update, context, "room", "Пример: `/room 5427`")
+
+async def lessons_by_command(update: Update, context: ContextTypes.DEFAULT_TYPE, kind: str, example: str):
+    if not context.args:
+        what = "фамилию преподавателя" if kind == "teacher" else "номер аудитории"
+        await update.message.reply_text(f"Укажите {what}.\n{example}", parse_mode='Markdown')
+        return
+    
+    result = await AsyncLETIScheduleAPI.find_lessons_by(kind, " ".join(context.args))
+    if not result["success"]:
+        # В тексте ошибки - запрос пользователя: `_` или `*` в нём сломали бы разметку
+        await update.message.reply_text(f"❌ {escape_markdown(result['error'])}", parse_mode='Markdown')
+        return
+    
+    for page in LETIScheduleAPI.format_lessons_by(result):
+        await update.message.reply_text(page, parse_mode='Markdown')
+
+# Команда /ics
+async def ics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Файл .ics с расписанием группы на семестр для импорта в календарь"""
+    group = group_for_chat(update, context.args[0] if context.args else None)
+    if not group:
+        await update.message.reply_text(
+            "Укажите номер группы.\nПример: `/ics 4352`" + GROUP_HINT,
+            parse_mode='Markdown'
+        )
+        return
+    
+    result = await AsyncLETIScheduleAPI.get_group_ics(group)
+    if not result["success"]:
+        await update.message.reply_text(f"❌ {result['error']}")
+        return
+    
+    start, end = result["semester"]
+    caption = f"📆 Расписание группы {group} с {start:%d.%m.%Y} по {end:%d.%m.%Y}"
+    
+    # Файл, уже загруженный в Telegram, отправляем повторно по file_id - без новой загрузки
+    file_ids = context.bot_data.setdefault("ics_file_ids", {})
+    key = (group, start, result["version"])
+    document = file_ids.get(key) or InputFile(io.BytesIO(result["content"]), filename=result["filename"])
+    
+    message = await update.message.reply_document(document, caption=caption)
+    if key not in file_ids and message.document:
+        # file_id прошлых версий расписания этой группы больше не нужны
+        for old_key in [k for k in file_ids if k[0] == group]:
+            del file_ids[old_key]
+        file_ids[key] = message.document.file_id
+
+# Команда /testapi
+async def test_api_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Проверка API ЛЭТИ: одна загрузка расписания (или кэш) и параллельная
+    проверка любого числа групп по ней
+
+    /testapi [fresh] [группа ...] - fresh принудительно загружает расписание заново
+    """
+    args = list(context.args)
+    fresh = bool(args) and args[0].lower() == "fresh"
+    if fresh:
+        args = args[1:]
+    # Повторы не проверяем дважды, порядок сохраняем
+    test_groups = list(dict.fromkeys(args)) or DEFAULT_TEST_GROUPS
+    
+    await update.message.reply_text("🔧 Тестирую подключение к API ЛЭТИ...")
+    
+    started = time.perf_counter()
+    try:
+        if fresh:
+            await schedule_store.refresh()
+        else:
+            await schedule_store.get_index()
+    except Exception as e:
+        await update.message.reply_text(f"❌ API ЛЭТИ недоступен: {e}")
+        return
+    fetch_ms = (time.perf_counter() - started) * 1000
+    
+    # Все группы проверяются по одному индексу, повторных загрузок нет
+    results = await asyncio.gather(*[
+        AsyncLETIScheduleAPI.get_group_schedule(group) for group in test_groups
+    ])
+    
+    header = "📊 *Результаты теста API ЛЭТИ:*\n\n"
+    header += format_fetch_report(fresh, fetch_ms)
+    header += "\n"
+    
+    lines = []
+    ok = 0
+    for group, result in zip(test_groups, results):
+        if result["success"]:
+            # Номер найден в индексе - это номер из расписания, разметку он не ломает
+            ok += 1
+            lines.append(f"✅ Группа *{group}*: {result['total_lessons']} занятий\n")
+        else:
+            # Номер ввёл пользователь - экранируем его вместе с текстом ошибки
+            lines.append(f"❌ {escape_markdown(result['error'].splitlines()[0])}\n")
+    
+    footer = f"\nГрупп в порядке: {ok} из {len(test_groups)}\n"
+    footer += "\n📡 *Для использования:*\n"
+    footer += "/today [группа] - расписание на сегодня\n"
+    footer += "/week [группа] - вся неделя\n"
+    footer += "/day [день] [неделя] [группа] - конкретный день\n"
+    
+    # Длинный список групп не влезает в одно сообщение - делим по строкам
+    for page in LETIScheduleAPI.paginate(header, lines + [footer]):
+        await update.message.reply_text(page, parse_mode='Markdown')
+
+def format_fetch_report(fresh: bool, fetch_ms: float) -> str:
+    """Строки отчёта /testapi о последней загрузке расписания"""
+    index = schedule_store.current_index()
+    age = schedule_store.age_seconds()
+    stats = schedule_store.last_refresh_stats
+    
+    source = "загружено заново" if fresh else "из кэша"
+    lines = [
+        f"📦 Источник: {source}, версия {schedule_store.version}",
+        f"⏱ Получение индекса: {fetch_ms:.0f} мс",
+    ]
+    if age is not None:
+        lines.append(f"🕒 Возраст данных: {age:.0f} с")
+    if index is not None:
+        lines.append(f"👥 Групп в индексе: {len(index.groups())}")
+    
+    if not stats:
+        lines.append("Загрузок с сервера ещё не было (данные из снимка)")
+        return "\n".join(lines) + "\n"
+    
+    statuses = {
+        "updated": "расписание обновлено",
+        "unchanged": "ответ не изменился",
+        "not_modified": "304 Not Modified",
+    }
+    lines.append("")
+    lines.append(f"*Последняя загрузка* ({stats['finished_at']}): {statuses[stats['status']]}")
+    lines.append(f"• Ответ сервера: {stats['latency_ms']:.0f} мс")
+    if "size_bytes" in stats:
+        lines.append(f"• Размер ответа: {stats['size_bytes'] / 1024:.0f} КБ")
+    if "parse_ms" in stats:
+        if stats["streaming"]:
+            lines.append(f"• Разбор + индекс (потоково, из временного файла): {stats['parse_ms']:.0f} мс")
+        else:
+            lines.append(f"• Разбор JSON: {stats['parse_ms']:.0f} мс")
+            lines.append(f"• Построение индекса: {stats['index_ms']:.0f} мс")
+    lines.append(f"• Всего: {stats['total_ms']:.0f} мс")
+    return "\n".join(lines) + "\n"
+
+# Команда /subscribe
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Подписка чата на уведомления об изменении расписания группы"""
+    group = group_for_chat(update, context.args[0] if context.args else None)
+    if not group:
+        await update.message.reply_text(
+            "Укажите номер группы.\nПример: `/subscribe 4352`" + GROUP_HINT,
+            parse_mode='Markdown'
+        )
+        return
+    
+    chat_id = update.effective_chat.id
+    
+    # Проверяем, что группа есть в расписании
+    schedule = await AsyncLETIScheduleAPI.get_group_schedule(group)
+    if not schedule["success"]:
+        await update.message.reply_text(f"❌ {schedule['error']}")
+        return
+    
+    if subscriptions.subscribe_changes(chat_id, group):
+        response = f"🔔 Буду сообщать об изменениях расписания группы *{group}*"
     else:
-        # Если не нашли ближайшее, покажем первое занятие на неделе
-        if schedule["lessons"]:
-            # Сортируем правильно
-            def get_lesson_sort_key(lesson):
-                day_name = lesson.get("day_name", "")
-                try:
-                    day_index = days_api_format.index(day_name)
-                except:
-                    day_index = 999
-                time_str = lesson.get("start_time", "23:59")
-                return (day_index, time_to_minutes(time_str))
-            
-            first_lesson = sorted(schedule["lessons"], key=get_lesson_sort_key)[0]
-            
-            day_name = first_lesson.get("day_name", "").lower().capitalize()
-            time_start = first_lesson.get("start_time", "??:??")
-            time_end = first_lesson.get("end_time", "??:??")
-            subject = first_lesson.get("name", "Не указано")
-            
+        response = f"Вы уже подписаны на изменения группы *{group}*"
+    
+    await update.message.reply_text(response, parse_mode='Markdown')
+
+# Команда /group
+async def group_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Группа по умолчанию для команд без номера группы"""
+    chat_id = update.effective_chat.id
+    
+    if not context.args:
+        group = preferences.default_group(chat_id)
+        if group:
             response = (
-                f"🔍 *Ближайшее занятие для группы {group}:*\n\n"
-                f"📅 *{day_name}*\n"
-                f"🕐 *{time_start}-{time_end}*\n"
-                f"📚 {subject}\n"
-                f"📆 {'Нечетная' if week_type == '1' else 'Четная'} неделя\n\n"
-                f"💡 *Сегодня и завтра пар нет*"
+                f"👥 Группа по умолчанию: *{group}*\n"
+                f"Сменить: `/group 4352`, забыть: `/group off`"
             )
         else:
-            response = f"📭 У группы {group} нет занятий на этой неделе."
+            response = "Группа по умолчанию не выбрана.\nПример: `/group 4352`"
+        await update.message.reply_text(response, parse_mode='Markdown')
+        return
     
-    await update.message.reply_text(response, parse_mode='Markdown')
+    if context.args[0].lower() in ['off', 'stop', 'выкл']:
+        if preferences.clear_default_group(chat_id):
+            await update.message.reply_text("Группа по умолчанию забыта")
+        else:
+            await update.message.reply_text("Группа по умолчанию не была выбрана")
+        return
+    
+    group = context.args[0]
+    
+    # Проверяем, что группа есть в расписании
+    schedule = await AsyncLETIScheduleAPI.get_group_schedule(group)
+    if not schedule["success"]:
+        await update.message.reply_text(f"❌ {schedule['error']}")
+        return
+    
+    preferences.set_default_group(chat_id, group)
+    await update.message.reply_text(
+        f"👥 Группа *{group}* выбрана по умолчанию: теперь можно писать просто /today, /week, /near",
+        parse_mode='Markdown'
+    )
 
-# Команда /testapi
-async def test_api_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Тестирование подключения к API ЛЭТИ"""
-    await update.message.reply_text("🔧 Тестирую подключение к API ЛЭТИ...")
+def group_for_chat(update: Update, group: str = None):
+    """
+    Группа из аргумента команды, а без него - группа чата по умолчанию
+    
+    Первая явно указанная существующая группа запоминается как группа по умолчанию.
+    """
+    chat_id = update.effective_chat.id
+    
+    if not group:
+        return preferences.default_group(chat_id)
+    
+    if preferences.default_group(chat_id) is None:
+        index = schedule_store.current_index()
+        if index is not None and index.has_group(group):
+            preferences.set_default_group(chat_id, group)
+    return group
+
+# Фоновая задача: запись настроек чатов на диск
+async def flush_preferences(context: ContextTypes.DEFAULT_TYPE):
+    """Записать накопившиеся изменения настроек одной транзакцией"""
+    if preferences.has_pending():
+        await asyncio.to_thread(preferences.flush)
+
+# Команда /unsubscribe
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отписка от уведомлений об изменении расписания"""
+    chat_id = update.effective_chat.id
+    group = context.args[0] if context.args else None
+    
+    removed = subscriptions.unsubscribe_changes(chat_id, group)
+    
+    if removed:
+        response = f"🔕 Уведомления отключены для групп: {', '.join(removed)}"
+    elif group:
+        response = f"Вы не подписаны на изменения группы {group}"
+    else:
+        response = "У вас нет подписок на изменения расписания"
+    
+    await update.message.reply_text(response)
+
+# Фоновая задача: уведомления об изменениях
+async def check_schedule_changes(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Сравнить текущую версию расписания с прошлой проверкой
+    и разослать уведомления подписанным чатам
+    
+    Задача не ходит на сервер сама - она смотрит на общий кэш,
+    так что одна загрузка расписания обслуживает всех подписчиков.
+    """
+    state = context.job.data
+    index = schedule_store.current_index()
+    
+    if index is None or schedule_store.version == state.get("version"):
+        return
     
-    test_groups = ['4341', '3301', '2302', '1381', '4301']
-    response_text = "📊 *Результаты теста API ЛЭТИ:*\n\n"
+    old_index = state.get("index")
+    state["index"] = index
+    state["version"] = schedule_store.version
     
-    for group in test_groups:
-        result = LETIScheduleAPI.get_group_schedule(group)
+    # Первая проверка - только запоминаем версию
+    if old_index is None:
+        return
+    
+    messages = []
+    for group in ScheduleChanges.changed_groups(old_index, index, subscriptions.change_groups()):
+        added, removed = ScheduleChanges.diff_group(old_index, index, group)
+        if not added and not removed:
+            continue
         
-        if result["success"]:
-            lessons = result["total_lessons"]
-            response_text += f"✅ Группа *{group}*: {lessons} занятий\n"
+        text = ScheduleChanges.format_changes(group, added, removed)
+        logger.info(f"Расписание группы {group} изменилось, уведомляю подписчиков")
+        messages.extend((chat_id, text) for chat_id in subscriptions.change_subscribers(group))
+    
+    if messages:
+        # Бота заблокировали - подписка больше не нужна
+        sender = BatchSender(context.bot, on_forbidden=subscriptions.unsubscribe_changes)
+        await sender.send_many(messages)
+
+# Команда /digest
+async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Настройка ежедневной рассылки расписания на завтра"""
+    chat_id = update.effective_chat.id
+    
+    if not context.args:
+        digest = subscriptions.digest_of(chat_id)
+        if digest:
+            response = (
+                f"📬 Расписание группы *{digest['group']}* на завтра приходит каждый день в {digest['time']}\n"
+                f"Отключить: `/digest off`"
+            )
         else:
-            response_text += f"❌ Группа *{group}*: {result['error']}\n"
+            response = (
+                "Укажите номер группы и время.\n"
+                "Пример: `/digest 4352 20:00` (или `/digest 20:00` для группы по умолчанию)"
+            )
+        await update.message.reply_text(response, parse_mode='Markdown')
+        return
+    
+    if context.args[0].lower() in ['off', 'stop', 'выкл']:
+        if subscriptions.unsubscribe_digest(chat_id):
+            await update.message.reply_text("🔕 Ежедневная рассылка отключена")
+        else:
+            await update.message.reply_text("Ежедневная рассылка не была включена")
+        return
     
-    response_text += "\n📡 *Для использования:*\n"
-    response_text += "/today [группа] - расписание на сегодня\n"
-    response_text += "/week [группа] - вся неделя\n"
-    response_text += "/day [день] [неделя] [группа] - конкретный день\n"
+    # /digest ЧЧ:ММ - для группы по умолчанию
+    args = list(context.args)
+    if ":" in args[0]:
+        group = group_for_chat(update)
+        if not group:
+            await update.message.reply_text(
+                "Укажите номер группы. Пример: `/digest 4352 20:00`" + GROUP_HINT,
+                parse_mode='Markdown'
+            )
+            return
+    else:
+        group = group_for_chat(update, args.pop(0))
+    time_input = args[0] if args else DEFAULT_DIGEST_TIME
     
-    await update.message.reply_text(response_text, parse_mode='Markdown')
+    try:
+        send_time = datetime.strptime(time_input, "%H:%M").strftime("%H:%M")
+    except ValueError:
+        await update.message.reply_text(
+            "❌ Время нужно указать в формате ЧЧ:ММ, например `/digest 4352 19:30`",
+            parse_mode='Markdown'
+        )
+        return
+    
+    # Проверяем, что группа есть в расписании
+    schedule = await AsyncLETIScheduleAPI.get_group_schedule(group)
+    if not schedule["success"]:
+        await update.message.reply_text(f"❌ {schedule['error']}")
+        return
+    
+    subscriptions.subscribe_digest(chat_id, group, send_time)
+    await update.message.reply_text(
+        f"📬 Каждый день в {send_time} буду присылать расписание группы *{group}* на завтра",
+        parse_mode='Markdown'
+    )
+
+# Фоновая задача: ежедневная рассылка
+async def send_daily_digests(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Разослать расписание на завтра чатам, у которых наступило время рассылки
+    
+    Задача только выбирает получателей за все минуты с прошлого запуска
+    и сразу возвращается: сама отправка тысяч сообщений идёт отдельной
+    задачей, иначе очередные запуски пропускались бы вместе со своими минутами.
+    """
+    from datetime import timedelta
+    
+    state = context.job.data
+    current_minute = datetime.now().replace(second=0, microsecond=0)
+    last_minute = state.get("last_minute")
+    if last_minute is None or current_minute - last_minute > timedelta(minutes=DIGEST_CATCHUP_MINUTES):
+        last_minute = current_minute - timedelta(minutes=1)
+    
+    # Задача запускается чаще раза в минуту - каждую минуту обрабатываем один раз
+    if current_minute <= last_minute:
+        return
+    state["last_minute"] = current_minute
+    
+    due = []
+    minute = last_minute + timedelta(minutes=1)
+    while minute <= current_minute:
+        due.extend(subscriptions.digests_at(minute.strftime("%H:%M")))
+        minute += timedelta(minutes=1)
+    if not due:
+        return
+    
+    # Рассылки за разные минуты идут по очереди, чтобы вместе не превысить лимит Telegram
+    lock = state.setdefault("lock", asyncio.Lock())
+    label = current_minute.strftime("%H:%M")
+    context.application.create_task(deliver_digests(context.bot, due, lock, label), name=f"digest_{label}")
+
+async def deliver_digests(bot, due, lock: asyncio.Lock, label: str):
+    """Собрать сообщение для каждой группы один раз и разослать его пачками"""
+    async with lock:
+        rendered = {}
+        for _, group in due:
+            if group not in rendered:
+                rendered[group] = await tomorrow_message(group)
+        
+        sender = BatchSender(bot, on_forbidden=subscriptions.unsubscribe_digest)
+        sent, failed = await sender.send_many((chat_id, rendered[group]) for chat_id, group in due)
+    logger.info(f"Рассылка {label}: отправлено {sent}, ошибок {failed}")
 
 # Обработка кнопок
 async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -464,32 +1040,27 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"🔄 Пользователь {user_id} нажал: {text}")
     
     if text == "📅 Сегодня":
-        await update.message.reply_text(
-            "Введите номер группы (например: 4352):"
-        )
-        context.user_data['action'] = 'today'
-        context.user_data['step'] = 'waiting_group'
+        await run_group_action(update, context, 'today')
         
     elif text == "⏭️ Завтра":
-        await update.message.reply_text(
-            "Введите номер группы (например: 4352):"
-        )
-        context.user_data['action'] = 'tomorrow'
-        context.user_data['step'] = 'waiting_group'
+        await run_group_action(update, context, 'tomorrow')
         
     elif text == "🔍 Ближайшая":
-        await update.message.reply_text(
-            "Введите номер группы (например: 4352):"
-        )
-        context.user_data['action'] = 'near'
-        context.user_data['step'] = 'waiting_group'
+        await run_group_action(update, context, 'near')
         
     elif text == "📋 Вся неделя":
+        await run_group_action(update, context, 'week')
+        
+    elif text == "🗓️ Выбрать день" and preferences.default_group(update.effective_chat.id):
+        # Группа уже известна - сразу к выбору дня
+        context.user_data['action'] = 'custom_day'
+        context.user_data['group'] = preferences.default_group(update.effective_chat.id)
         await update.message.reply_text(
-            "Введите номер группы (например: 4352):"
+            f"✅ Группа: {context.user_data['group']}\n\n"
+            f"Теперь выберите день недели:",
+            reply_markup=get_days_keyboard()
         )
-        context.user_data['action'] = 'week'
-        context.user_data['step'] = 'waiting_group'
+        context.user_data['step'] = 'waiting_day'
         
     elif text == "🗓️ Выбрать день":
         # Показываем инструкцию для ручного ввода команды /day
@@ -518,7 +1089,24 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Пользователь ввёл номер группы
         group = text.strip()
         
+        # Проверяем номер по индексу в памяти: опечатка не стоит запроса к серверу
+        index = schedule_store.current_index()
+        if group.isdigit() and index is not None and not index.has_group(group):
+            suggestions = index.suggest_groups(group)
+            response = f"❌ Группа {group} не найдена."
+            if suggestions:
+                response += "\nВозможно, вы имели в виду одну из этих групп:"
+            else:
+                response += "\nПроверьте номер и введите его ещё раз."
+            
+            await update.message.reply_text(
+                response,
+                reply_markup=get_groups_keyboard(suggestions)
+            )
+            return
+        
         if group.isdigit() and 1000 <= int(group) <= 9999:
+            group_for_chat(update, group)
             context.user_data['group'] = group
             action = context.user_data['action']
             
@@ -588,6 +1176,26 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=get_main_keyboard()
         )
 
+async def run_group_action(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str):
+    """Кнопка меню: сразу ответить по группе по умолчанию или спросить номер группы"""
+    group = preferences.default_group(update.effective_chat.id)
+    if group:
+        context.args = [group]
+        handlers = {
+            'today': today_schedule,
+            'tomorrow': tomorrow_schedule,
+            'near': near_lesson,
+            'week': week_schedule
+        }
+        await handlers[action](update, context)
+        return
+    
+    await update.message.reply_text(
+        "Введите номер группы (например: 4352):"
+    )
+    context.user_data['action'] = action
+    context.user_data['step'] = 'waiting_group'
+
 def get_day_selection_keyboard():
     """Клавиатура для выбора дня недели"""
     keyboard = [
@@ -598,6 +1206,25 @@ def get_day_selection_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
+def get_pages_keyboard(key: str, page: int, total: int):
+    """Inline-кнопки листания страниц (None, если страница одна)"""
+    if total <= 1:
+        return None
+    
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️", callback_data=f"pg:{key}:{page - 1}"))
+    buttons.append(InlineKeyboardButton(f"{page + 1}/{total}", callback_data=f"pg:{key}:{page}"))
+    if page < total - 1:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=f"pg:{key}:{page + 1}"))
+    return InlineKeyboardMarkup([buttons])
+
+def get_groups_keyboard(groups):
+    """Клавиатура с подсказками номеров групп"""
+    keyboard = [[KeyboardButton(group) for group in groups]] if groups else []
+    keyboard.append([KeyboardButton("↩️ Назад")])
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
+
 def get_days_keyboard():
     """Клавиатура с днями недели"""
     keyboard = [
@@ -615,6 +1242,49 @@ def get_weeks_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
+def instrument_handlers(application: Application):
+    """Обернуть все зарегистрированные обработчики замером времени и ошибок"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = metrics.instrument_handler(handler.callback.__name__, handler.callback)
+
+def setup_metrics(application: Application):
+    """Показатели, которые считываются в момент запроса /metrics"""
+    metrics.FETCH_BYTES.set_function(lambda: schedule_store.last_refresh_stats.get("size_bytes"))
+    metrics.SCHEDULE_AGE.set_function(schedule_store.age_seconds)
+    metrics.SCHEDULE_VERSION.set_function(lambda: schedule_store.version)
+    metrics.RENDER_CACHE_HITS.set_function(lambda: render_cache.hits)
+    metrics.RENDER_CACHE_MISSES.set_function(lambda: render_cache.misses)
+    
+    # Очередь приложения при параллельной обработке сразу разбирается в задачи;
+    # ждущие обновления копятся в процессоре - в очередях чатов и за свободным слотом
+    processor = application.update_processor
+    if isinstance(processor, PerChatUpdateProcessor):
+        metrics.UPDATE_QUEUE_SIZE.set_function(
+            lambda: application.update_queue.qsize() + processor.waiting_updates()
+        )
+    else:
+        metrics.UPDATE_QUEUE_SIZE.set_function(application.update_queue.qsize)
+
+async def post_init(application: Application):
+    """Общий кэш расписания: загружаем сразу и обновляем в фоне"""
+    schedule_store.start_auto_refresh()
+    
+    if metrics_server.port:
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            logger.error(
+                f"Не удалось запустить сервер метрик на {metrics_server.host}:{metrics_server.port}: {e}. "
+                f"Выберите другой порт в METRICS_PORT"
+            )
+
+async def post_shutdown(application: Application):
+    """Закрываем пул HTTP-соединений к API ЛЭТИ и сервер метрик, сохраняем настройки"""
+    await metrics_server.stop()
+    await schedule_store.close()
+    await asyncio.to_thread(preferences.flush)
+
 # Главная функция
 def main():
     """Запуск бота"""
@@ -623,10 +1293,42 @@ def main():
     print(f"🔧 Токен: {TOKEN[:15]}...")
     
     try:
+        # Режим работы: polling (по умолчанию) или webhook
+        mode = os.getenv('BOT_MODE', 'polling').lower()
+        # Разные чаты обрабатываются параллельно, обновления одного чата - по порядку
+        concurrent_updates = int(os.getenv('CONCURRENT_UPDATES', 16))
+        
         # Создаем приложение
-        application = Application.builder().token(TOKEN).build()
+        builder = (
+            Application.builder()
+            .token(TOKEN)
+            .concurrent_updates(PerChatUpdateProcessor(concurrent_updates))
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+        )
+        # Другой адрес Bot API, например локальная заглушка для тестов
+        api_url = os.getenv('TELEGRAM_API_URL')
+        if api_url:
+            builder = builder.base_url(api_url).base_file_url(os.getenv('TELEGRAM_FILE_URL', api_url))
+        application = builder.build()
+        
+        schedule_store.ttl = int(os.getenv('SCHEDULE_TTL', ScheduleStore.DEFAULT_TTL))
+        schedule_store.snapshot_path = os.getenv('SCHEDULE_SNAPSHOT', ScheduleStore.DEFAULT_SNAPSHOT_PATH)
+        if os.getenv('SCHEDULE_STREAMING') == '0':
+            schedule_store.streaming = False
+        
+        # Учебный календарь: семестры, праздники и ручная смена чётности недель
+        academic_calendar.path = os.getenv('ACADEMIC_CALENDAR', AcademicCalendar.DEFAULT_PATH)
+        academic_calendar.load()
         
+        # Тёплый старт: отвечаем по последнему снимку, пока идёт первая загрузка
+        schedule_store.load_snapshot()
         
+        subscriptions.path = os.getenv('SUBSCRIPTIONS_FILE', SubscriptionStore.DEFAULT_PATH)
+        subscriptions.load()
+        
+        preferences.path = os.getenv('PREFERENCES_DB', PreferencesStore.DEFAULT_PATH)
+        preferences.load()
         
         # Регистрируем обработчики
         application.add_handler(CommandHandler("start", start))
@@ -637,10 +1339,58 @@ def main():
         application.add_handler(CommandHandler("near", near_lesson))
         application.add_handler(CommandHandler("week", week_schedule))
         application.add_handler(CommandHandler("all", week_schedule))  # Алиас для /week
+        application.add_handler(CommandHandler("range", range_schedule))
+        application.add_handler(CommandHandler("free", free_slots_command))
+        application.add_handler(CommandHandler("teacher", teacher_command))
+        application.add_handler(CommandHandler("room", room_command))
+        application.add_handler(CommandHandler("ics", ics_command))
+        application.add_handler(CommandHandler("subscribe", subscribe_command))
+        application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
+        application.add_handler(CommandHandler("digest", digest_command))
+        application.add_handler(CommandHandler("group", group_command))
+        application.add_handler(CommandHandler("testapi", test_api_command))
+        
+        # Проверка изменений расписания для подписчиков
+        changes_interval = int(os.getenv('CHANGES_CHECK_INTERVAL', 300))
+        application.job_queue.run_repeating(
+            check_schedule_changes,
+            interval=changes_interval,
+            first=0,  # сразу запоминаем версию из снимка, чтобы заметить изменения за время простоя
+            data={},
+            name="schedule_changes"
+        )
+        
+        # Настройки чатов пишутся на диск пачками, а не при каждом изменении
+        application.job_queue.run_repeating(
+            flush_preferences,
+            interval=int(os.getenv('PREFERENCES_FLUSH_INTERVAL', 30)),
+            name="flush_preferences"
+        )
+        
+        # Ежедневная рассылка: проверяем чаще раза в минуту, чтобы не пропустить минуту
+        application.job_queue.run_repeating(
+            send_daily_digests,
+            interval=20,
+            first=0,
+            data={},
+            name="daily_digests"
+        )
+        
+        # Листание длинных расписаний
+        application.add_handler(CallbackQueryHandler(page_callback, pattern=r"^pg:"))
+        
+        # Inline-режим (@бот 4352 завтра); включается в @BotFather командой /setinline
+        application.add_handler(InlineQueryHandler(inline_query))
         
         # Обработчик кнопок
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_buttons))
         
+        # Метрики: время работы каждого обработчика, кэш, очередь обновлений
+        instrument_handlers(application)
+        setup_metrics(application)
+        metrics_server.host = os.getenv('METRICS_HOST', MetricsServer.DEFAULT_HOST)
+        metrics_server.port = int(os.getenv('METRICS_PORT', MetricsServer.DEFAULT_PORT))
+        
         # Запускаем бота
         logger.info("🤖 Бот запускается...")
         print("=" * 50)
@@ -653,7 +1403,17 @@ def main():
         print("/week [группа] - вся неделя")
         print("=" * 50)
         
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if mode == 'webhook':
+            server = WebhookServer(
+                application,
+                host=os.getenv('WEBHOOK_HOST', WebhookServer.DEFAULT_HOST),
+                port=int(os.getenv('WEBHOOK_PORT', WebhookServer.DEFAULT_PORT)),
+                path=os.getenv('WEBHOOK_PATH', WebhookServer.DEFAULT_PATH),
+                secret_token=os.getenv('WEBHOOK_SECRET')
+            )
+            asyncio.run(run_webhook(application, server, webhook_url=os.getenv('WEBHOOK_URL')))
+        else:
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
         
     except Exception as e:
         logger.error(f"Ошибка запуска бота: {e}")
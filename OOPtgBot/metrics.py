@@ -0,0 +1,320 @@
+"""
+Метрики бота в текстовом формате Prometheus.
+
+Счётчики, гистограммы и вычисляемые показатели регистрируются в общем
+реестре REGISTRY и отдаются локальным HTTP-сервером на /metrics, откуда
+их забирает Prometheus (или любой другой сборщик). p50/p99 задержек
+считаются на стороне сборщика по корзинам гистограмм (histogram_quantile).
+
+Сторонних зависимостей нет: HTTP-сервер - aiohttp, который уже нужен боту.
+"""
+
+import asyncio
+import functools
+import logging
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Корзины задержек в секундах: от быстрых ответов из памяти до загрузки /schedule
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """Набор метрик, которые отдаются на /metrics"""
+
+    def __init__(self):
+        self._metrics: List = []
+        self._lock = threading.Lock()
+
+    def register(self, metric) -> None:
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Counter:
+    """Счётчик, который только растёт"""
+
+    TYPE = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        registry: MetricsRegistry = REGISTRY
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        key = tuple(str(value) for value in label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge:
+    """Показатель, который вычисляется функцией в момент запроса /metrics"""
+
+    TYPE = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        function: Optional[Callable[[], Optional[float]]] = None,
+        registry: MetricsRegistry = REGISTRY
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        registry.register(self)
+
+    def set_function(self, function: Callable[[], Optional[float]]) -> None:
+        self.function = function
+
+    def samples(self) -> Iterable[str]:
+        if self.function is None:
+            return
+        try:
+            value = self.function()
+        except Exception as e:
+            logger.warning(f"Не удалось вычислить метрику {self.name}: {e}")
+            return
+        if value is not None:
+            yield f"{self.name} {_format_value(value)}"
+
+
+class FunctionCounter(Gauge):
+    """
+    Счётчик, значение которого берётся функцией в момент запроса /metrics
+
+    Для величин, которые только растут и уже считаются в другом месте
+    (например, попадания в кэш): тип counter позволяет брать от них rate().
+    """
+
+    TYPE = "counter"
+
+
+class Histogram:
+    """Распределение значений (обычно задержек в секундах) по корзинам"""
+
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: MetricsRegistry = REGISTRY
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # метки -> [количество в каждой корзине, сумма, количество]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value: float, *label_values: str) -> None:
+        key = tuple(str(label) for label in label_values)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            series = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class MetricsServer:
+    """Локальный HTTP-сервер, отдающий метрики на /metrics"""
+
+    DEFAULT_HOST = "127.0.0.1"
+    DEFAULT_PORT = 9321  # 9100 обычно занят node_exporter
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, registry: MetricsRegistry = REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(),
+            content_type="text/plain",
+            charset="utf-8",
+            headers={"X-Content-Type-Options": "nosniff"}
+        )
+
+
+# ---------- Метрики бота ----------
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds",
+    "Время работы обработчика обновления Telegram",
+    labels=("handler",)
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total",
+    "Обработчики, завершившиеся исключением",
+    labels=("handler",)
+)
+API_CALL_SECONDS = Histogram(
+    "leti_api_call_seconds",
+    "Время вызова методов LETIScheduleAPI",
+    labels=("method",)
+)
+API_CALLS = Counter(
+    "leti_api_calls_total",
+    "Вызовы методов LETIScheduleAPI по результату",
+    labels=("method", "success")
+)
+FETCH_SECONDS = Histogram(
+    "leti_schedule_fetch_seconds",
+    "Загрузка /schedule с сервера ЛЭТИ (вместе с разбором)",
+    labels=("status",)
+)
+FETCH_ERRORS = Counter(
+    "leti_schedule_fetch_errors_total",
+    "Неудачные загрузки /schedule"
+)
+FETCH_BYTES = Gauge("leti_schedule_payload_bytes", "Размер последнего ответа /schedule")
+SCHEDULE_AGE = Gauge("leti_schedule_age_seconds", "Сколько секунд назад расписание загружено или подтверждено")
+SCHEDULE_VERSION = Gauge("leti_schedule_version", "Номер версии расписания в памяти")
+RENDER_CACHE_HITS = FunctionCounter("bot_render_cache_hits_total", "Попадания в кэш готовых текстов расписания")
+RENDER_CACHE_MISSES = FunctionCounter("bot_render_cache_misses_total", "Промахи кэша готовых текстов расписания")
+UPDATE_QUEUE_SIZE = Gauge(
+    "bot_update_queue_size",
+    "Обновления Telegram, ожидающие обработки (в очереди приложения и в очередях чатов)"
+)
+
+
+def instrument_handler(name: str, callback: Callable) -> Callable:
+    """Обернуть обработчик Telegram: время работы и ошибки по имени обработчика"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(1, name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
+
+def instrument_api(method: str):
+    """Декоратор для методов LETIScheduleAPI: время вызова и успешность результата"""
+    def record(result, started: float) -> None:
+        API_CALL_SECONDS.observe(time.perf_counter() - started, method)
+        # Методы, возвращающие словарь, сообщают об ошибке полем success
+        success = result.get("success", False) if isinstance(result, dict) else True
+        API_CALLS.inc(1, method, "true" if success else "false")
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                result = await func(*args, **kwargs)
+                record(result, started)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            record(result, started)
+            return result
+        return wrapper
+
+    return decorator
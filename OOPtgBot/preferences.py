@@ -0,0 +1,117 @@
+"""
+Настройки чатов: группа по умолчанию.
+
+Настройки хранятся в SQLite, но обработчики читают их только из памяти:
+при старте таблица целиком загружается в словарь, а изменения копятся
+и записываются на диск пачкой (write-behind) - периодически и при остановке
+бота. Так команды без номера группы не обращаются к диску.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PreferencesStore:
+    """Группа по умолчанию для каждого чата"""
+
+    DEFAULT_PATH = "preferences.db"
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._groups: Dict[int, str] = {}             # чат -> группа
+        self._dirty: Dict[int, Optional[str]] = {}    # ещё не записано; None - удалить
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS preferences ("
+            "chat_id INTEGER PRIMARY KEY, "
+            "group_number TEXT NOT NULL, "
+            "updated_at INTEGER NOT NULL)"
+        )
+        return connection
+
+    def load(self) -> None:
+        """Прочитать все настройки из базы в память"""
+        try:
+            connection = self._connect()
+            try:
+                rows = connection.execute("SELECT chat_id, group_number FROM preferences").fetchall()
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось прочитать настройки {self.path}: {e}")
+            return
+
+        with self._lock:
+            self._groups = {chat_id: group for chat_id, group in rows}
+        logger.info(f"Загружены настройки {len(rows)} чатов")
+
+    def default_group(self, chat_id: int) -> Optional[str]:
+        """Группа чата по умолчанию (из памяти) или None"""
+        return self._groups.get(chat_id)
+
+    def set_default_group(self, chat_id: int, group_number: str) -> bool:
+        """Запомнить группу чата. False, если она и так была выбрана"""
+        with self._lock:
+            if self._groups.get(chat_id) == group_number:
+                return False
+            self._groups[chat_id] = group_number
+            self._dirty[chat_id] = group_number
+        return True
+
+    def clear_default_group(self, chat_id: int) -> bool:
+        """Забыть группу чата. False, если её не было"""
+        with self._lock:
+            if self._groups.pop(chat_id, None) is None:
+                return False
+            self._dirty[chat_id] = None
+        return True
+
+    def has_pending(self) -> bool:
+        return bool(self._dirty)
+
+    def flush(self) -> int:
+        """
+        Записать накопившиеся изменения в базу одной транзакцией
+
+        Returns:
+            int: сколько чатов записано
+        """
+        with self._lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, {}
+
+        now = int(time.time())
+        upserts = [(chat_id, group, now) for chat_id, group in dirty.items() if group is not None]
+        deletes = [(chat_id,) for chat_id, group in dirty.items() if group is None]
+
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.executemany(
+                        "INSERT INTO preferences (chat_id, group_number, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(chat_id) DO UPDATE SET "
+                        "group_number = excluded.group_number, updated_at = excluded.updated_at",
+                        upserts
+                    )
+                    connection.executemany("DELETE FROM preferences WHERE chat_id = ?", deletes)
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось сохранить настройки: {e}")
+            # Вернуть изменения в очередь, не затирая более новые
+            with self._lock:
+                for chat_id, group in dirty.items():
+                    self._dirty.setdefault(chat_id, group)
+            return 0
+
+        return len(dirty)
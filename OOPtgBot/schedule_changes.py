@@ -0,0 +1,71 @@
+"""
+Поиск изменений в расписании между двумя версиями индекса.
+"""
+
+from typing import List, Tuple
+
+from lesson import Lesson
+from schedule_index import ScheduleIndex
+
+
+class ScheduleChanges:
+    """Сравнение версий расписания группы и текст уведомления"""
+
+    MAX_ITEMS = 10  # сколько занятий показывать в каждом списке уведомления
+
+    @staticmethod
+    def changed_groups(old_index: ScheduleIndex, new_index: ScheduleIndex, groups) -> List[str]:
+        """Группы из списка, у которых расписание отличается (по хэшу занятий)"""
+        return [
+            group for group in groups
+            if old_index.group_fingerprint(group) != new_index.group_fingerprint(group)
+        ]
+
+    @staticmethod
+    def diff_group(
+        old_index: ScheduleIndex,
+        new_index: ScheduleIndex,
+        group_number: str
+    ) -> Tuple[List[Lesson], List[Lesson]]:
+        """
+        Сравнить занятия группы в двух версиях
+
+        Returns:
+            (добавленные занятия, убранные занятия)
+        """
+        old_lessons = {lesson.key(): lesson for lesson in old_index.group_lessons(group_number)}
+        new_lessons = {lesson.key(): lesson for lesson in new_index.group_lessons(group_number)}
+
+        added = [lesson for key, lesson in new_lessons.items() if key not in old_lessons]
+        removed = [lesson for key, lesson in old_lessons.items() if key not in new_lessons]
+        return added, removed
+
+    @staticmethod
+    def format_changes(group_number: str, added: List[Lesson], removed: List[Lesson]) -> str:
+        """Текст уведомления об изменениях для Telegram (Markdown)"""
+        lines = [f"🔔 *Изменилось расписание группы {group_number}*", ""]
+
+        for title, lessons in (("➕ *Добавлено:*", added), ("➖ *Убрано:*", removed)):
+            if not lessons:
+                continue
+
+            lines.append(title)
+            for lesson in lessons[:ScheduleChanges.MAX_ITEMS]:
+                lines.append(ScheduleChanges._format_lesson(lesson))
+            if len(lessons) > ScheduleChanges.MAX_ITEMS:
+                lines.append(f"... и ещё {len(lessons) - ScheduleChanges.MAX_ITEMS}")
+            lines.append("")
+
+        lines.append(f"Полное расписание: /week {group_number}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _format_lesson(lesson: Lesson) -> str:
+        day_name = lesson.day_name.capitalize()
+        # Занятие без чётности идёт каждую неделю - неделю не указываем
+        week = {"1": " (нечет.)", "2": " (чет.)"}.get(lesson.week, "")
+        line = f"• {day_name}{week} {lesson.start_time} — {lesson.name or 'Не указано'}"
+
+        if lesson.room:
+            line += f", {lesson.room}"
+        return line
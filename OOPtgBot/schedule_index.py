@@ -0,0 +1,434 @@
+"""
+Индекс занятий по группам.
+
+Строится один раз на каждую загруженную версию /schedule, чтобы обработчики
+команд получали занятия по (группа, неделя, день) поиском в словаре,
+а не перебором и копированием всех занятий группы. Занятия хранятся
+компактными записями Lesson, а не словарями из ответа API.
+"""
+
+import hashlib
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from lesson import Lesson
+
+# Ключ таблицы: (неделя или None, номер дня или None); None - любая
+TableKey = Tuple[Optional[str], Optional[int]]
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+CYCLE_MINUTES = 2 * MINUTES_PER_WEEK  # нечетная + четная неделя
+
+# Битовые маски занятости: один бит - SLOT_MINUTES минут двухнедельного цикла
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = MINUTES_PER_DAY // SLOT_MINUTES
+
+
+class ReverseIndex:
+    """
+    Занятия всех групп по значению одного поля (преподаватель, аудитория)
+
+    Заполняется при построении индекса; поиск по началу имени - бинарный
+    по отсортированному списку ключей, без перебора групп.
+    """
+
+    def __init__(self):
+        self._lessons: Dict[str, List[Tuple[str, Lesson]]] = defaultdict(list)  # ключ -> (группа, занятие)
+        self._names: Dict[str, str] = {}    # ключ -> имя, как в расписании
+        self._sorted_keys: Optional[List[str]] = None
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        return " ".join(name.lower().replace("ё", "е").split())
+
+    def add(self, value: str, group_number: str, lesson: Lesson) -> None:
+        """Добавить занятие; в поле может быть несколько имён через запятую"""
+        for name in value.replace(";", ",").split(","):
+            key = self.normalize(name)
+            if not key:
+                continue
+            self._lessons[key].append((group_number, lesson))
+            self._names.setdefault(key, name.strip())
+            self._sorted_keys = None
+
+    def search(self, prefix: str, limit: int = 10) -> List[str]:
+        """Имена, начинающиеся с prefix (без учёта регистра), по алфавиту"""
+        prefix = self.normalize(prefix)
+        if not prefix:
+            return []
+
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self._lessons)
+
+        names = []
+        position = bisect_left(self._sorted_keys, prefix)
+        while position < len(self._sorted_keys) and len(names) < limit:
+            key = self._sorted_keys[position]
+            if not key.startswith(prefix):
+                break
+            names.append(self._names[key])
+            position += 1
+        return names
+
+    def lessons(self, name: str) -> List[Tuple[str, Lesson]]:
+        """Занятия (группа, занятие) по точному имени, по неделе, дню и времени"""
+        entries = self._lessons.get(self.normalize(name), [])
+        return sorted(entries, key=lambda entry: (entry[1].week, entry[1].sort_key, entry[0]))
+
+
+class ScheduleIndex:
+    """Предпостроенные таблицы занятий для всех групп"""
+
+    DAY_NUMBERS = ["0", "1", "2", "3", "4", "5", "6"]
+    MAX_GROUP_LENGTH = 8  # для подсказок: номера групп ЛЭТИ короче
+
+    def __init__(self, payload: Optional[Union[Dict, Iterable[Tuple[str, Dict]]]] = None):
+        """
+        Args:
+            payload: ответ /schedule ({группа: данные}) или поток пар (группа, данные),
+                     например из потокового парсера; None - пустой индекс
+        """
+        self.version = 0  # номер версии данных, назначает ScheduleStore
+        self._tables: Dict[str, Dict[TableKey, Tuple[Lesson, ...]]] = {}
+        self._day_numbers: Dict[str, Dict[str, int]] = {}
+        self._totals: Dict[str, int] = {}
+        self._fingerprints: Dict[str, str] = {}
+        # Лента занятий для /near: (отсортированные начала в минутах от начала
+        # двухнедельного цикла, занятия в том же порядке)
+        self._timelines: Dict[str, Tuple[List[int], List[Lesson]]] = {}
+        # Занятость группы за двухнедельный цикл битами (для поиска общих окон)
+        self._busy_masks: Dict[str, int] = {}
+        # Обратные индексы: преподаватель -> занятия, аудитория -> занятия
+        self.teachers = ReverseIndex()
+        self.rooms = ReverseIndex()
+        # Отсортированные номера групп для подсказок (строится при первом обращении)
+        self._sorted_groups: Optional[List[str]] = None
+
+        items = payload.items() if isinstance(payload, dict) else (payload or ())
+        for group_number, group_data in items:
+            self.add_group(group_number, group_data)
+
+    def add_group(self, group_number: str, group_data: Dict) -> None:
+        """Добавить в индекс занятия одной группы (данные группы после этого не нужны)"""
+        lessons = []
+        day_numbers = {}
+
+        for day_num, day_info in group_data.get("days", {}).items():
+            day_name = day_info.get("name", "").strip().lower()
+
+            # Запись Lesson создаётся один раз при построении индекса, а не на каждый запрос
+            for lesson in day_info.get("lessons", []):
+                lessons.append(Lesson.from_api(lesson, day_num, day_name))
+
+            if str(day_num).isdigit():
+                day_numbers[day_name] = int(day_num)
+
+        lessons.sort(key=lambda lesson: lesson.sort_key)
+
+        tables = defaultdict(list)
+        for lesson in lessons:
+            self.teachers.add(lesson.teacher, group_number, lesson)
+            self.rooms.add(lesson.room, group_number, lesson)
+            tables[(None, None)].append(lesson)
+            tables[(lesson.week, None)].append(lesson)
+            tables[(None, lesson.day)].append(lesson)
+            tables[(lesson.week, lesson.day)].append(lesson)
+
+        self._tables[group_number] = {key: tuple(value) for key, value in tables.items()}
+        self._day_numbers[group_number] = day_numbers
+        self._totals[group_number] = len(lessons)
+        self._sorted_groups = None
+
+    def has_group(self, group_number: str) -> bool:
+        return group_number in self._tables
+
+    def groups(self):
+        return self._tables.keys()
+
+    def suggest_groups(self, group_number: str, limit: int = 3) -> List[str]:
+        """
+        Существующие номера групп, похожие на введённый
+
+        Сначала идут номера, отличающиеся одной опечаткой (перестановка соседних
+        цифр, замена, пропуск или лишняя цифра) - каждый вариант проверяется
+        поиском в словаре. Если таких мало, добавляются номера той же длины,
+        отличающиеся только последним символом (соседние группы потока).
+        Непохожим номерам ничего не подсказывается.
+        """
+        group_number = group_number.strip()
+        # Строка длиннее любого номера группы - не опечатка, а мусор: не тратим на неё время
+        if not group_number or len(group_number) > self.MAX_GROUP_LENGTH:
+            return []
+
+        suggestions = []
+        for variant in self._one_edit_variants(group_number):
+            if variant in self._tables and variant not in suggestions:
+                suggestions.append(variant)
+                if len(suggestions) == limit:
+                    return suggestions
+
+        if self._sorted_groups is None:
+            self._sorted_groups = sorted(self._tables, key=lambda g: (len(g), g))
+
+        # Номера с тем же началом и той же длины лежат в отсортированном списке подряд
+        prefix = group_number[:-1]
+        position = bisect_left(self._sorted_groups, (len(group_number), prefix),
+                               key=lambda g: (len(g), g))
+        neighbours = []
+        while position < len(self._sorted_groups):
+            candidate = self._sorted_groups[position]
+            if len(candidate) != len(group_number) or not candidate.startswith(prefix):
+                break
+            if candidate != group_number and candidate not in suggestions:
+                neighbours.append(candidate)
+            position += 1
+
+        # Ближе по номеру - выше в списке
+        if group_number.isdigit():
+            neighbours.sort(key=lambda g: abs(int(g) - int(group_number)) if g.isdigit() else len(g))
+        return suggestions + neighbours[:limit - len(suggestions)]
+
+    @staticmethod
+    def _one_edit_variants(text: str) -> Iterator[str]:
+        """
+        Строки на расстоянии одной правки от text (в порядке вероятности опечатки)
+
+        Генератор: поиск останавливается, как только набралось нужное число подсказок.
+        """
+        alphabet = "0123456789" if text.isdigit() else "0123456789абвгдежзиклмнопрстуфхцчшщэюя"
+
+        for i in range(len(text) - 1):
+            yield text[:i] + text[i + 1] + text[i] + text[i + 2:]
+        for i in range(len(text)):
+            for c in alphabet:
+                if c != text[i]:
+                    yield text[:i] + c + text[i + 1:]
+        for i in range(len(text)):
+            yield text[:i] + text[i + 1:]
+        for i in range(len(text) + 1):
+            for c in alphabet:
+                yield text[:i] + c + text[i:]
+
+    def total_lessons(self, group_number: str) -> int:
+        """Сколько всего занятий у группы (по всем неделям и дням)"""
+        return self._totals.get(group_number, 0)
+
+    def lookup(
+        self,
+        group_number: str,
+        week_type: Optional[str] = None,
+        day: Optional[str] = None
+    ) -> Tuple[Lesson, ...]:
+        """
+        Занятия группы, отсортированные по дню и времени начала
+
+        Args:
+            group_number: номер группы
+            week_type: тип недели ('1'/'2', odd/even, нечетная/четная)
+            day: номер дня (0-6) или название, как в API
+        """
+        tables = self._tables.get(group_number)
+        if tables is None:
+            return ()
+
+        week_key = self.normalize_week(week_type) if week_type else None
+
+        day_key = None
+        if day:
+            day_str = str(day).lower().strip()
+            if day_str in self.DAY_NUMBERS:
+                day_key = int(day_str)
+            else:
+                day_key = self._day_numbers[group_number].get(day_str)
+                if day_key is None:
+                    return ()
+
+        return tables.get((week_key, day_key), ())
+
+    def group_lessons(self, group_number: str) -> Tuple[Lesson, ...]:
+        """Все занятия группы (обе недели, все дни)"""
+        return self._tables.get(group_number, {}).get((None, None), ())
+
+    def group_fingerprint(self, group_number: str) -> str:
+        """Хэш занятий группы: совпадает у двух версий, если расписание группы не менялось"""
+        fingerprint = self._fingerprints.get(group_number)
+        if fingerprint is None:
+            keys = sorted(repr(lesson.key()) for lesson in self.group_lessons(group_number))
+            fingerprint = hashlib.sha256("\n".join(keys).encode("utf-8")).hexdigest()
+            self._fingerprints[group_number] = fingerprint
+        return fingerprint
+
+    def next_lesson(
+        self,
+        group_number: str,
+        week_type: str,
+        weekday: int,
+        minutes: int
+    ) -> Optional[Tuple[Lesson, int]]:
+        """
+        Ближайшее занятие группы, которое начинается не раньше заданного момента
+
+        Поиск - бинарный по ленте занятий двухнедельного цикла, поэтому
+        ближайшее занятие может оказаться и на следующей неделе (с другой чётностью).
+
+        Args:
+            week_type: чётность текущей недели ('1'/'2')
+            weekday: день недели (0 - понедельник)
+            minutes: минуты от начала суток
+
+        Returns:
+            (занятие, через сколько минут оно начнётся) или None, если занятий нет
+        """
+        offsets, lessons = self._timeline(group_number)
+        if not offsets:
+            return None
+
+        parity = 0 if self.normalize_week(week_type) == "1" else 1
+        now = parity * MINUTES_PER_WEEK + weekday * MINUTES_PER_DAY + minutes
+
+        position = bisect_left(offsets, now)
+        if position == len(offsets):
+            position = 0  # дальше в цикле занятий нет - берём первое следующего цикла
+
+        minutes_ahead = (offsets[position] - now) % CYCLE_MINUTES
+        return lessons[position], minutes_ahead
+
+    def _timeline(self, group_number: str) -> Tuple[List[int], List[Lesson]]:
+        """Лента занятий группы; строится при первом обращении и живёт до следующей версии"""
+        timeline = self._timelines.get(group_number)
+        if timeline is not None:
+            return timeline
+
+        entries = []
+        for lesson in self.group_lessons(group_number):
+            if lesson.start is None or lesson.day == Lesson.UNKNOWN_DAY:
+                continue
+
+            day_offset = lesson.day * MINUTES_PER_DAY + lesson.start
+            # Занятие без чётности идёт каждую неделю
+            parities = [0] if lesson.week == "1" else [1] if lesson.week == "2" else [0, 1]
+            for parity in parities:
+                entries.append((parity * MINUTES_PER_WEEK + day_offset, lesson))
+
+        entries.sort(key=lambda entry: entry[0])
+        timeline = ([offset for offset, _ in entries], [lesson for _, lesson in entries])
+        self._timelines[group_number] = timeline
+        return timeline
+
+    def busy_mask(self, group_number: str) -> int:
+        """
+        Занятость группы за двухнедельный цикл в виде целого числа-битсета
+
+        Бит номер (чётность * 7 + день) * SLOTS_PER_DAY + слот установлен,
+        если в этот SLOT_MINUTES-минутный слот у группы идёт занятие.
+        Строится при первом обращении и живёт до следующей версии.
+        """
+        mask = self._busy_masks.get(group_number)
+        if mask is not None:
+            return mask
+
+        mask = 0
+        for lesson in self.group_lessons(group_number):
+            if lesson.start is None or lesson.end is None or lesson.day == Lesson.UNKNOWN_DAY:
+                continue
+
+            first = lesson.start // SLOT_MINUTES
+            last = -(-lesson.end // SLOT_MINUTES)  # округление вверх
+            run = (1 << max(last - first, 0)) - 1
+
+            parities = [0] if lesson.week == "1" else [1] if lesson.week == "2" else [0, 1]
+            for parity in parities:
+                mask |= run << ((parity * 7 + lesson.day) * SLOTS_PER_DAY + first)
+
+        self._busy_masks[group_number] = mask
+        return mask
+
+    def common_free_slots(
+        self,
+        groups: Iterable[str],
+        week_type: Optional[str] = None,
+        day_start: int = 8 * 60,
+        day_end: int = 20 * 60,
+        min_minutes: int = 30
+    ) -> List[Tuple[str, int, int, int]]:
+        """
+        Окна, когда все группы свободны одновременно
+
+        Занятость групп объединяется одним OR по битсетам, а окна находятся
+        одним AND с маской рабочего времени - без перебора занятий и дней.
+
+        Args:
+            week_type: '1'/'2' - только эта неделя, None - обе
+            day_start, day_end: рабочее время в минутах от начала суток (пн-сб)
+            min_minutes: окна короче не показываются
+
+        Returns:
+            список (неделя '1'/'2', день 0-6, начало, конец) в минутах от начала суток
+        """
+        busy = 0
+        for group_number in groups:
+            busy |= self.busy_mask(group_number)
+
+        parities = [0, 1]
+        if week_type:
+            parities = [0] if self.normalize_week(week_type) == "1" else [1]
+
+        first, last = day_start // SLOT_MINUTES, day_end // SLOT_MINUTES
+        day_window = ((1 << (last - first)) - 1) << first
+        window = 0
+        for parity in parities:
+            for day in range(6):
+                window |= day_window << ((parity * 7 + day) * SLOTS_PER_DAY)
+
+        free = window & ~busy
+        day_mask = (1 << SLOTS_PER_DAY) - 1
+        min_slots = -(-min_minutes // SLOT_MINUTES)
+
+        slots = []
+        for parity in parities:
+            for day in range(6):
+                bits = (free >> ((parity * 7 + day) * SLOTS_PER_DAY)) & day_mask
+                position = 0
+                # Раскладываем день на отрезки подряд идущих единиц
+                while bits:
+                    skip = (bits & -bits).bit_length() - 1
+                    bits >>= skip
+                    position += skip
+                    length = (~bits & (bits + 1)).bit_length() - 1
+                    if length >= min_slots:
+                        slots.append((
+                            str(parity + 1), day,
+                            position * SLOT_MINUTES, (position + length) * SLOT_MINUTES
+                        ))
+                    bits >>= length
+                    position += length
+
+        return slots
+
+    def iter_payload(self) -> Iterator[Tuple[str, Dict]]:
+        """
+        Данные индекса в формате ответа /schedule, по одной группе (для снимка на диске)
+
+        Словарь каждой группы собирается только на время записи этой группы.
+        """
+        for group_number, tables in self._tables.items():
+            days = {}
+            for lesson in tables.get((None, None), ()):
+                day = days.setdefault(str(lesson.day), {
+                    "name": lesson.day_name,
+                    "lessons": []
+                })
+                day["lessons"].append(lesson.to_api())
+            yield group_number, {"days": days}
+
+    @staticmethod
+    def normalize_week(week_type: str) -> str:
+        """Привести тип недели к формату API ("1"/"2")"""
+        week = week_type.lower()
+        if week in ["odd", "нечетная", "odd_week", "1"]:
+            return "1"
+        if week in ["even", "четная", "even_week", "2"]:
+            return "2"
+        return week_type
@@ -0,0 +1,474 @@
+"""
+Общее хранилище расписания ЛЭТИ.
+
+Держит в памяти индекс последнего загруженного ответа /schedule и обновляет
+его в фоне по истечении TTL (stale-while-revalidate): пока идёт обновление,
+обработчики получают предыдущую версию данных.
+
+Загрузка идёт через aiohttp с общим пулом соединений, чтобы не блокировать
+цикл событий бота; разбор и построение индекса уносятся в отдельный поток.
+
+Одновременные запросы на обновление объединяются (single-flight): загрузку
+выполняет первый вызвавший, остальные ждут и получают тот же результат.
+
+Последнее успешно загруженное расписание сохраняется в сжатый снимок на диске.
+Снимок читается при старте бота и служит запасным вариантом, если сервер ЛЭТИ
+недоступен.
+
+Плановые обновления почти бесплатны, если расписание не менялось: запрос
+идёт с If-None-Match / If-Modified-Since, а если сервер их не поддерживает,
+хэш ответа сравнивается с предыдущим, и индекс не перестраивается.
+
+Если установлен ijson, ответ не держится в памяти целиком: при загрузке он
+пишется во временный файл с подсчётом хэша, и только если хэш изменился,
+индекс строится по одной группе потоковым разбором этого файла. Снимок
+на диск тоже пишется по одной группе.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+try:
+    import ijson
+except ImportError:  # без ijson ответ разбирается целиком через json
+    ijson = None
+
+from metrics import FETCH_ERRORS, FETCH_SECONDS
+from schedule_index import ScheduleIndex
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduleFetchError(Exception):
+    """Ошибка загрузки расписания с сервера ЛЭТИ"""
+
+
+class _HashingReader:
+    """Обёртка над потоком aiohttp (StreamReader): считает SHA-256 всего прочитанного"""
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._hash = hashlib.sha256()
+        self.size = 0  # сколько байт прочитано
+
+    async def read(self, size: int = -1) -> bytes:
+        data = await self._raw.read(size)
+        self._hash.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+class ScheduleStore:
+    """Кэш полного расписания /schedule, общий для всего процесса"""
+
+    DEFAULT_TTL = 600        # секунд между обновлениями
+    RETRY_DELAY = 60         # пауза после неудачного обновления
+    REQUEST_TIMEOUT = 15
+    POOL_SIZE = 10           # соединений в пуле aiohttp
+    CHUNK_SIZE = 64 * 1024   # по сколько байт ответ пишется во временный файл
+    DEFAULT_SNAPSHOT_PATH = "schedule_snapshot.json.gz"
+
+    def __init__(self, url: str, ttl: int = DEFAULT_TTL, snapshot_path: Optional[str] = DEFAULT_SNAPSHOT_PATH):
+        self.url = url
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.streaming = ijson is not None  # потоковый разбор ответа
+        # Замеры последней загрузки (для /testapi): задержка ответа, размер, время разбора
+        self.last_refresh_stats: Dict = {}
+        self._index: Optional[ScheduleIndex] = None
+        self._loaded_at = 0.0
+        self._last_attempt = 0.0
+        self._version = 0
+        self._content_hash: Optional[str] = None
+        self._validators: Dict[str, str] = {}   # ETag / Last-Modified последнего ответа
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._inflight: Optional[asyncio.Task] = None
+        self._background_task: Optional[asyncio.Task] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._auto_refresh_task: Optional[asyncio.Task] = None
+        self._refresh_listeners: List[Callable[[], None]] = []
+
+    @property
+    def version(self) -> int:
+        """Номер текущей версии данных (растёт при каждом обновлении)"""
+        return self._version
+
+    def current_index(self) -> Optional[ScheduleIndex]:
+        """Текущий индекс без загрузки и обновления (None, если данных ещё нет)"""
+        return self._index
+
+    def is_loaded(self) -> bool:
+        return self._index is not None
+
+    def age_seconds(self) -> Optional[float]:
+        """Сколько секунд назад данные загружены или подтверждены сервером"""
+        if self._index is None:
+            return None
+        return time.monotonic() - self._loaded_at
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._loaded_at >= self.ttl
+
+    def _can_refresh_in_background(self) -> bool:
+        """Проверить и занять флаг фонового обновления"""
+        with self._lock:
+            if self._refreshing:
+                return False
+            if time.monotonic() - self._last_attempt < self.RETRY_DELAY and self._index is not None:
+                return False
+            self._refreshing = True
+            return True
+
+    def add_refresh_listener(self, callback: Callable[[], None]) -> None:
+        """Вызывать callback каждый раз, когда появляется новая версия данных"""
+        self._refresh_listeners.append(callback)
+
+    def _notify_listeners(self) -> None:
+        for callback in self._refresh_listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Ошибка в обработчике обновления расписания: {e}")
+
+    def _apply(self, index: ScheduleIndex, content_hash: str, validators: Dict[str, str]) -> ScheduleIndex:
+        """Сделать новый индекс текущим"""
+        with self._lock:
+            self._version += 1
+            index.version = self._version
+            self._index = index
+            self._content_hash = content_hash
+            self._validators = validators
+            self._loaded_at = time.monotonic()
+
+        logger.info(f"Расписание обновлено (версия {self._version}, групп: {len(index.groups())})")
+        self._notify_listeners()
+        return index
+
+    def _mark_fresh(self, validators: Dict[str, str]) -> ScheduleIndex:
+        """Расписание на сервере не изменилось: продлеваем срок жизни текущего индекса"""
+        with self._lock:
+            self._validators = validators
+            self._loaded_at = time.monotonic()
+
+        logger.info(f"Расписание не изменилось (версия {self._version})")
+        return self._index
+
+    def _build_if_changed(self, body: bytes, stats: Dict) -> Tuple[str, Optional[ScheduleIndex]]:
+        """
+        Построить индекс по ответу сервера, только если содержимое изменилось
+
+        Args:
+            stats: сюда записываются время разбора JSON и построения индекса
+
+        Returns:
+            (хэш ответа, новый индекс или None, если ответ тот же, что и раньше)
+        """
+        content_hash = hashlib.sha256(body).hexdigest()
+
+        if content_hash == self._content_hash and self._index is not None:
+            return content_hash, None
+
+        started = time.perf_counter()
+        data = json.loads(body)
+        stats["parse_ms"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        index = ScheduleIndex(data)
+        stats["index_ms"] = (time.perf_counter() - started) * 1000
+        return content_hash, index
+
+    def _build_from_spool_if_changed(self, spool, content_hash: str, stats: Dict) -> Optional[ScheduleIndex]:
+        """
+        Построить индекс потоковым разбором сохранённого ответа, только если содержимое изменилось
+
+        Args:
+            spool: временный файл с телом ответа
+            content_hash: хэш, посчитанный при записи файла
+
+        Returns:
+            новый индекс или None, если ответ тот же, что и раньше
+        """
+        if content_hash == self._content_hash and self._index is not None:
+            return None
+
+        spool.seek(0)
+        started = time.perf_counter()
+        index = ScheduleIndex(ijson.kvitems(spool, "", use_float=True))
+        # При потоковом разборе JSON и индекс строятся одновременно
+        stats["parse_ms"] = (time.perf_counter() - started) * 1000
+        return index
+
+    def _use_streaming(self) -> bool:
+        return self.streaming and ijson is not None
+
+    def _record_stats(self, stats: Dict, status: str, started: float) -> None:
+        """Сохранить замеры загрузки; status - updated / unchanged / not_modified"""
+        stats["status"] = status
+        stats["total_ms"] = (time.perf_counter() - started) * 1000
+        stats["finished_at"] = datetime.now().isoformat(timespec="seconds")
+        self.last_refresh_stats = stats
+        FETCH_SECONDS.observe(stats["total_ms"] / 1000, status)
+
+    def _conditional_headers(self) -> Dict[str, str]:
+        """Заголовки условного запроса по ETag / Last-Modified прошлого ответа"""
+        if self._index is None:
+            return {}
+
+        headers = {}
+        if "ETag" in self._validators:
+            headers["If-None-Match"] = self._validators["ETag"]
+        if "Last-Modified" in self._validators:
+            headers["If-Modified-Since"] = self._validators["Last-Modified"]
+        return headers
+
+    def _response_validators(self, headers) -> Dict[str, str]:
+        """ETag / Last-Modified из заголовков ответа (при 304 их может не быть)"""
+        validators = {
+            name: headers[name]
+            for name in ("ETag", "Last-Modified")
+            if headers.get(name)
+        }
+        return validators or dict(self._validators)
+
+    # ---------- Снимок на диске ----------
+
+    def load_snapshot(self) -> bool:
+        """
+        Загрузить расписание из снимка на диске
+
+        Данные из снимка считаются устаревшими, поэтому при первом же
+        обращении запустится обновление с сервера.
+
+        Returns:
+            bool: True, если снимок найден и загружен
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+
+        try:
+            with gzip.open(self.snapshot_path, "rt", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            index = ScheduleIndex(snapshot["groups"])
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать снимок расписания {self.snapshot_path}: {e}")
+            return False
+
+        with self._lock:
+            # Свежие данные с сервера важнее снимка
+            if self._index is not None:
+                return True
+            self._version += 1
+            index.version = self._version
+            self._index = index
+            self._content_hash = snapshot.get("content_hash")
+            self._validators = snapshot.get("validators", {})
+            self._loaded_at = time.monotonic() - self.ttl
+
+        logger.info(f"Расписание загружено из снимка от {snapshot.get('saved_at')}")
+        self._notify_listeners()
+        return True
+
+    def _save_snapshot(self, index: ScheduleIndex) -> None:
+        """Атомарно записать снимок: сначала во временный файл, потом переименовать"""
+        if not self.snapshot_path:
+            return
+
+        header = {
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+            "content_hash": self._content_hash,
+            "validators": self._validators,
+        }
+        tmp_path = f"{self.snapshot_path}.tmp"
+
+        def dumps(value) -> str:
+            return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                # {"saved_at":...,"groups":{...}} - группы пишутся по одной,
+                # словарь всего расписания в памяти не собирается
+                f.write(dumps(header)[:-1] + ',"groups":{')
+                for i, (group_number, group_data) in enumerate(index.iter_payload()):
+                    f.write(("," if i else "") + dumps(group_number) + ":" + dumps(group_data))
+                f.write("}}")
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить снимок расписания: {e}")
+
+    # ---------- Загрузка ----------
+
+    async def get_index(self) -> ScheduleIndex:
+        """
+        Получить индекс расписания всех групп
+
+        Первый вызов ждёт загрузки. Дальше данные отдаются из памяти,
+        а устаревшие обновляются фоновой задачей.
+        Если сервер недоступен, используется снимок с диска.
+        """
+        if self._index is None:
+            try:
+                return await self.refresh()
+            except Exception:
+                if await asyncio.to_thread(self.load_snapshot):
+                    return self._index
+                raise
+
+        if self.is_stale():
+            self.refresh_in_background()
+
+        return self._index
+
+    async def refresh(self) -> ScheduleIndex:
+        """
+        Загрузить свежее расписание и перестроить индекс
+
+        Если загрузка уже идёт, новый запрос не отправляется -
+        вызывающий дожидается уже запущенной.
+        """
+        if self._inflight is None:
+            self._inflight = asyncio.get_running_loop().create_task(self._refresh())
+            self._inflight.add_done_callback(self._on_inflight_done)
+
+        # shield: отмена одного ожидающего не отменяет общую загрузку
+        return await asyncio.shield(self._inflight)
+
+    def _on_inflight_done(self, task: asyncio.Task) -> None:
+        self._inflight = None
+        if not task.cancelled():
+            task.exception()  # ошибку получат ожидающие, здесь только помечаем её прочитанной
+
+    async def _refresh(self) -> ScheduleIndex:
+        self._last_attempt = time.monotonic()
+        try:
+            content_hash, index, validators = await self._download()
+        except Exception:
+            FETCH_ERRORS.inc()
+            raise
+        if index is None:
+            return self._mark_fresh(validators)
+
+        self._apply(index, content_hash, validators)
+        await asyncio.to_thread(self._save_snapshot, index)
+        return index
+
+    def refresh_in_background(self) -> None:
+        """Запустить обновление задачей в текущем цикле событий"""
+        if not self._can_refresh_in_background():
+            return
+
+        # Цикл событий держит задачи по слабой ссылке: без своей ссылки задачу
+        # может собрать сборщик мусора, и флаг _refreshing останется поднятым
+        self._background_task = asyncio.get_running_loop().create_task(self._background_refresh())
+
+    async def _background_refresh(self) -> None:
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning(f"Не удалось обновить расписание: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+            self._background_task = None
+
+    def start_auto_refresh(self) -> None:
+        """Загружать расписание сразу и затем каждые ttl секунд (вызывать из цикла событий)"""
+        if self._auto_refresh_task is not None:
+            return
+
+        self._auto_refresh_task = asyncio.get_running_loop().create_task(self._auto_refresh_loop())
+
+    async def _auto_refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+                await asyncio.sleep(self.ttl)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Не удалось обновить расписание: {e}")
+                await asyncio.sleep(self.RETRY_DELAY)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия aiohttp: соединения переиспользуются между запросами"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT),
+                connector=aiohttp.TCPConnector(limit=self.POOL_SIZE, ssl=False)
+            )
+        return self._session
+
+    async def _download(self) -> Tuple[Optional[str], Optional[ScheduleIndex], Dict[str, str]]:
+        """
+        Загрузить /schedule через общую сессию aiohttp и построить индекс
+
+        Returns:
+            (хэш ответа, индекс, ETag/Last-Modified); индекс None, если сервер
+            ответил 304 Not Modified или содержимое не изменилось
+        """
+        session = self._get_session()
+        streaming = self._use_streaming()
+        stats = {"streaming": streaming}
+        started = time.perf_counter()
+
+        async with session.get(self.url, headers=self._conditional_headers()) as response:
+            stats["latency_ms"] = (time.perf_counter() - started) * 1000
+            validators = self._response_validators(response.headers)
+
+            if response.status == 304:
+                self._record_stats(stats, "not_modified", started)
+                return None, None, validators
+
+            if response.status != 200:
+                raise ScheduleFetchError(f"Ошибка API: {response.status}")
+
+            if not streaming:
+                body = await response.read()
+                stats["size_bytes"] = len(body)
+            else:
+                # Ответ копится на диске, а не в памяти; хэш считается по ходу чтения
+                reader = _HashingReader(response.content)
+                spool = tempfile.TemporaryFile()
+                try:
+                    while True:
+                        chunk = await reader.read(self.CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        spool.write(chunk)
+                except BaseException:
+                    spool.close()
+                    raise
+                stats["size_bytes"] = reader.size
+
+        # Хэш, разбор JSON и построение индекса - работа для CPU, уносим из цикла событий
+        if streaming:
+            content_hash = reader.hexdigest()
+            with spool:
+                index = await asyncio.to_thread(self._build_from_spool_if_changed, spool, content_hash, stats)
+        else:
+            content_hash, index = await asyncio.to_thread(self._build_if_changed, body, stats)
+        self._record_stats(stats, "updated" if index is not None else "unchanged", started)
+        return content_hash, index, validators
+
+    async def close(self) -> None:
+        """Остановить автообновление и закрыть пул соединений"""
+        if self._auto_refresh_task is not None:
+            self._auto_refresh_task.cancel()
+            self._auto_refresh_task = None
+
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -0,0 +1,148 @@
+"""
+Подписки чатов на уведомления бота: об изменениях расписания
+и ежедневная рассылка расписания на завтра.
+
+Подписок немного и меняются они редко, поэтому хранятся в JSON-файле,
+который перезаписывается при каждом изменении.
+"""
+
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionStore:
+    """Подписки чатов на изменения расписания групп и на ежедневную рассылку"""
+
+    DEFAULT_PATH = "subscriptions.json"
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._changes: Dict[str, Set[int]] = {}  # группа -> чаты
+        self._digests: Dict[int, Dict[str, str]] = {}  # чат -> {"group", "time"}
+        self._digests_by_time: Dict[str, Set[int]] = {}  # "ЧЧ:ММ" -> чаты
+
+    def load(self) -> None:
+        """Прочитать подписки из файла (если он есть)"""
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать подписки {self.path}: {e}")
+            return
+
+        self._changes = {
+            group: set(chat_ids)
+            for group, chat_ids in data.get("changes", {}).items()
+        }
+
+        self._digests = {}
+        self._digests_by_time = {}
+        for chat_id, digest in data.get("digests", {}).items():
+            self._add_digest(int(chat_id), digest["group"], digest["time"])
+
+    def save(self) -> None:
+        """Атомарно записать подписки в файл"""
+        data = {
+            "changes": {group: sorted(chat_ids) for group, chat_ids in self._changes.items()},
+            "digests": {str(chat_id): digest for chat_id, digest in self._digests.items()}
+        }
+        tmp_path = f"{self.path}.tmp"
+
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить подписки: {e}")
+
+    def subscribe_changes(self, chat_id: int, group_number: str) -> bool:
+        """Подписать чат на изменения группы. False, если подписка уже была"""
+        chats = self._changes.setdefault(group_number, set())
+        if chat_id in chats:
+            return False
+
+        chats.add(chat_id)
+        self.save()
+        return True
+
+    def unsubscribe_changes(self, chat_id: int, group_number: str = None) -> List[str]:
+        """
+        Отписать чат от изменений группы (или от всех групп, если группа не указана)
+
+        Returns:
+            List[str]: группы, от которых чат был отписан
+        """
+        groups = [group_number] if group_number else list(self._changes)
+        removed = []
+
+        for group in groups:
+            chats = self._changes.get(group)
+            if chats and chat_id in chats:
+                chats.discard(chat_id)
+                removed.append(group)
+                if not chats:
+                    del self._changes[group]
+
+        if removed:
+            self.save()
+        return removed
+
+    def change_groups(self) -> List[str]:
+        """Группы, на изменения которых кто-то подписан"""
+        return list(self._changes)
+
+    def change_subscribers(self, group_number: str) -> Set[int]:
+        """Чаты, подписанные на изменения группы"""
+        return set(self._changes.get(group_number, ()))
+
+    def groups_of(self, chat_id: int) -> List[str]:
+        """Группы, на изменения которых подписан чат"""
+        return sorted(group for group, chats in self._changes.items() if chat_id in chats)
+
+    def subscribe_digest(self, chat_id: int, group_number: str, send_time: str) -> None:
+        """Присылать чату расписание группы на завтра каждый день в send_time ("ЧЧ:ММ")"""
+        self._remove_digest(chat_id)
+        self._add_digest(chat_id, group_number, send_time)
+        self.save()
+
+    def unsubscribe_digest(self, chat_id: int) -> bool:
+        """Отключить ежедневную рассылку. False, если её не было"""
+        if not self._remove_digest(chat_id):
+            return False
+
+        self.save()
+        return True
+
+    def digest_of(self, chat_id: int) -> Optional[Dict[str, str]]:
+        """Настройки рассылки чата ({"group", "time"}) или None"""
+        return self._digests.get(chat_id)
+
+    def digests_at(self, send_time: str) -> List[Tuple[int, str]]:
+        """Чаты и их группы, которым рассылка положена в send_time ("ЧЧ:ММ")"""
+        return [
+            (chat_id, self._digests[chat_id]["group"])
+            for chat_id in self._digests_by_time.get(send_time, ())
+        ]
+
+    def _add_digest(self, chat_id: int, group_number: str, send_time: str) -> None:
+        self._digests[chat_id] = {"group": group_number, "time": send_time}
+        self._digests_by_time.setdefault(send_time, set()).add(chat_id)
+
+    def _remove_digest(self, chat_id: int) -> bool:
+        digest = self._digests.pop(chat_id, None)
+        if digest is None:
+            return False
+
+        chats = self._digests_by_time.get(digest["time"])
+        if chats:
+            chats.discard(chat_id)
+            if not chats:
+                del self._digests_by_time[digest["time"]]
+        return True
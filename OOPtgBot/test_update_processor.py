@@ -0,0 +1,107 @@
+"""
+Проверка PerChatUpdateProcessor: порядок внутри чата и общий лимит параллельности.
+
+Запуск: python -m unittest test_update_processor (или python -m pytest) из каталога OOPtgBot.
+"""
+
+import asyncio
+import random
+import unittest
+from datetime import datetime, timezone
+
+from telegram import Chat, Message, Update
+
+from update_processor import PerChatUpdateProcessor
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    """Обновление с сообщением из чата chat_id"""
+    chat = Chat(chat_id, Chat.PRIVATE)
+    message = Message(update_id, datetime.now(timezone.utc), chat)
+    return Update(update_id, message=message)
+
+
+class PerChatUpdateProcessorTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_keeps_order_within_chat_and_limits_concurrency(self):
+        processor = PerChatUpdateProcessor(3)
+        handled = {chat_id: [] for chat_id in range(5)}
+        active = 0
+        max_active = 0
+
+        async def handle(update: Update):
+            nonlocal active, max_active
+            active += 1
+            max_active = max(max_active, active)
+            await asyncio.sleep(random.uniform(0, 0.005))
+            handled[update.effective_chat.id].append(update.update_id)
+            active -= 1
+
+        updates = [make_update(update_id, update_id % 5) for update_id in range(60)]
+        await asyncio.gather(*[processor.process_update(update, handle(update)) for update in updates])
+
+        for chat_id, update_ids in handled.items():
+            self.assertEqual(update_ids, sorted(update_ids), f"чат {chat_id}")
+            self.assertEqual(len(update_ids), 12)
+        # Разные чаты обрабатывались параллельно, но не больше лимита
+        self.assertEqual(max_active, 3)
+
+    async def test_busy_chat_does_not_take_all_slots(self):
+        processor = PerChatUpdateProcessor(2)
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+
+        async def fast():
+            pass
+
+        # Первое обновление чата 1 зависло, за ним в очереди того же чата ещё десять
+        backlog = [
+            asyncio.create_task(processor.process_update(make_update(update_id, 1), slow()))
+            for update_id in range(11)
+        ]
+        await asyncio.sleep(0)
+        self.assertEqual(processor.waiting_updates(), 10)
+
+        # Другой чат получает свободный слот, не дожидаясь очереди чата 1
+        await asyncio.wait_for(processor.process_update(make_update(100, 2), fast()), timeout=1)
+
+        release.set()
+        await asyncio.gather(*backlog)
+        self.assertEqual(processor.waiting_updates(), 0)
+        self.assertEqual(processor._locks, {})
+        self.assertEqual(processor._pending, {})
+
+    async def test_releases_slot_after_handler_error(self):
+        processor = PerChatUpdateProcessor(1)
+
+        async def failing():
+            raise RuntimeError("ошибка обработчика")
+
+        async def ok():
+            return None
+
+        with self.assertRaises(RuntimeError):
+            await processor.process_update(make_update(1, 1), failing())
+
+        # Единственный слот освободился, очередь чата не зависла
+        await asyncio.wait_for(processor.process_update(make_update(2, 1), ok()), timeout=1)
+        self.assertEqual(processor.waiting_updates(), 0)
+        self.assertEqual(processor._locks, {})
+
+    async def test_updates_without_chat_use_slots_only(self):
+        processor = PerChatUpdateProcessor(2)
+        handled = []
+
+        async def handle(value):
+            handled.append(value)
+
+        await asyncio.gather(*[processor.process_update(value, handle(value)) for value in ("a", "b", "c")])
+
+        self.assertEqual(sorted(handled), ["a", "b", "c"])
+        self.assertEqual(processor._locks, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
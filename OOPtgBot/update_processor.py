@@ -0,0 +1,96 @@
+"""
+Параллельная обработка обновлений с сохранением порядка внутри чата.
+
+Обновления разных чатов обрабатываются одновременно (не больше
+max_concurrent_updates сразу), а обновления одного чата - строго по очереди:
+обработчик кнопок хранит пошаговое состояние в user_data, и следующий
+шаг не должен начаться, пока не закончился предыдущий.
+"""
+
+import asyncio
+from typing import Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Параллельно для разных чатов, последовательно внутри одного чата"""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._pending: Dict[int, int] = {}  # чат -> обновлений в работе и в ожидании
+        self._total = 0                     # обновлений в процессоре
+        self._active = 0                    # из них обрабатываются прямо сейчас
+
+    @staticmethod
+    def _chat_key(update: object) -> Optional[int]:
+        """Чат, к которому относится обновление (None - порядок не важен)"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    def waiting_updates(self) -> int:
+        """Сколько обновлений ждут своей очереди в чате или свободного слота"""
+        return self._total - self._active
+
+    async def process_update(self, update: object, coroutine: Awaitable) -> None:
+        """
+        Сначала очередь чата, потом общий лимит параллельности
+
+        Базовый класс занимает слот до вызова do_process_update, и обновления,
+        ждущие занятый чат, держали бы слоты впустую: один чат с десятком
+        сообщений в очереди остановил бы все остальные. Поэтому порядок
+        здесь обратный, а слоты считает собственный семафор.
+
+        В python-telegram-bot метод помечен @final (только для проверки типов),
+        поэтому версия библиотеки закреплена в requirements.txt.
+        """
+        key = self._chat_key(update)
+        self._total += 1
+        try:
+            if key is None:
+                await self._run(update, coroutine)
+                return
+
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = asyncio.Lock()
+            self._pending[key] = self._pending.get(key, 0) + 1
+
+            try:
+                # asyncio.Lock пропускает ожидающих в порядке прихода
+                async with lock:
+                    await self._run(update, coroutine)
+            finally:
+                self._pending[key] -= 1
+                if not self._pending[key]:
+                    # Блокировки чатов без обновлений не копятся
+                    del self._pending[key]
+                    del self._locks[key]
+        finally:
+            self._total -= 1
+
+    async def _run(self, update: object, coroutine: Awaitable) -> None:
+        """Занять слот и обработать обновление"""
+        async with self._slots:
+            self._active += 1
+            try:
+                await self.do_process_update(update, coroutine)
+            finally:
+                self._active -= 1
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
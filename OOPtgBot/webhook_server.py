@@ -0,0 +1,140 @@
+"""
+Приём обновлений Telegram через вебхук вместо run_polling.
+
+Локальный сервер aiohttp принимает POST от Telegram (или от локальной
+заглушки Bot API), проверяет секретный заголовок и кладёт обновление
+в очередь приложения - ответ Telegram уходит сразу, обработка идёт
+параллельно. При SIGINT/SIGTERM сервер перестаёт принимать запросы,
+приложение дообрабатывает очередь и корректно завершается.
+"""
+
+import asyncio
+import json
+import logging
+import signal
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """HTTP-сервер, передающий обновления из вебхука в Application"""
+
+    DEFAULT_HOST = "127.0.0.1"
+    DEFAULT_PORT = 8080
+    DEFAULT_PATH = "/telegram"
+
+    def __init__(
+        self,
+        application: Application,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        path: str = DEFAULT_PATH,
+        secret_token: Optional[str] = None
+    ):
+        """
+        Args:
+            application: приложение бота, в очередь которого идут обновления
+            host, port: адрес, на котором слушает сервер
+            path: путь вебхука
+            secret_token: если задан, запросы без этого заголовка отклоняются
+        """
+        self.application = application
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_update)
+        app.router.add_get("/healthz", self._handle_health)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Вебхук слушает http://{self.host}:{self.port}{self.path}")
+
+    async def stop(self) -> None:
+        """Перестать принимать запросы (уже принятые дорабатываются)"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        if self.secret_token and request.headers.get(SECRET_HEADER) != self.secret_token:
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return web.Response(status=400, text="Некорректный JSON")
+
+        update = Update.de_json(data, self.application.bot)
+        if update is None:
+            return web.Response(status=400, text="Пустое обновление")
+
+        # Обработка идёт в Application; Telegram ждать не заставляем
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+
+async def run_webhook(
+    application: Application,
+    server: WebhookServer,
+    webhook_url: Optional[str] = None
+) -> None:
+    """
+    Запустить бота в режиме вебхука и работать до SIGINT/SIGTERM
+
+    Args:
+        webhook_url: публичный адрес вебхука; если задан, он регистрируется
+            через setWebhook (без него адрес настраивается снаружи)
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: остановка по KeyboardInterrupt
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+
+    try:
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=server.secret_token,
+                allowed_updates=Update.ALL_TYPES
+            )
+
+        await application.start()
+        await server.start()
+
+        try:
+            await stop_event.wait()
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+
+        logger.info("Останавливаю вебхук...")
+        await server.stop()
+    finally:
+        # stop() дожидается обработки уже принятых обновлений
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)